@@ -67,18 +67,26 @@ def food(state):
     # 2) Pacman is not moving, and the food is within the visibilityLimit.
     #
     # In both cases, walls block the view.
-    
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
+    #
+    # The list is in the same column by column order as a scan of the
+    # food grid, sorted from the food index rather than scanned.
+
     # Return list of food that is visible
-    return foodList
+    return sorted(foodSet(state))
+
+def foodSet(state):
+    # Returns a frozenset of (x, y) pairs of food positions
+    #
+    # The game state keeps this index up to date as food is eaten, so
+    # unlike food() it costs nothing to call every move. Do not modify
+    # it.
+
+    return state.data._foodIndex
+
+def hasFood(state, pos):
+    # Returns true if there is food at pos, an (x, y) pair
+
+    return pos in foodSet(state)
 
 def walls(state):
     # Returns a list of (x, y) pairs of wall positions
@@ -86,16 +94,46 @@ def walls(state):
     # This version just returns all the current wall locations
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
-    
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+    #
+    # The walls of a layout never change, so they are only extracted
+    # the first time; every call returns a fresh copy of the list.
+
+    return list(wallIndex(state)[0])
+
+def wallSet(state):
+    # Returns a frozenset of (x, y) pairs of wall positions, for
+    # membership tests. Shared by every state on the same layout.
+
+    return wallIndex(state)[1]
+
+def isWall(state, pos):
+    # Returns true if there is a wall at pos, an (x, y) pair
+
+    return pos in wallSet(state)
+
+# Walls of each layout, keyed by its layout graph
+wallIndexCache = {}
+
+def wallIndex(state):
+    # Returns the walls of the layout as a tuple in the order walls()
+    # returns them and as a frozenset, extracted from the wall grid the
+    # first time any state on the same layout asks for them.
+
+    graph = layoutGraph(state)
+    if graph not in wallIndexCache:
+        wallList = state.getWalls().asList()
+        wallIndexCache[graph] = (tuple(wallList), frozenset(wallList))
+    return wallIndexCache[graph]
+
+def layoutGraph(state):
+    # Returns the compiled graph of the layout (see layout.py): every
+    # open cell has an integer id, and the cells next to it in each
+    # direction are precomputed.
+    #
+    # The graph is built once per layout and shared, so it is cheap to
+    # call this every move.
+
+    return state.getLayoutGraph()
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
@@ -178,59 +216,20 @@ def inFront(object, facing, state):
     # Returns true if the object is along the corridor in the
     # direction of the parameter "facing" before a wall gets in the
     # way.
-    
-    pacman = state.getPacmanPosition()
-    pacman_x = pacman[0]
-    pacman_y = pacman[1]
-    wallList = walls(state)
-
-    # If Pacman is facing North
-    if facing == Directions.NORTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] + 1)
-        return False
-
-    # If Pacman is facing South
-    if facing == Directions.SOUTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] - 1)
-        return False
+    #
+    # Walks the layout graph's successor table in the direction Pacman
+    # is facing until it reaches a wall.
 
-    # If Pacman is facing East
-    if facing == Directions.EAST:
-        # Check if the object is anywhere due East of Pacman before a
-        # wall intervenes.
-        next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] + 1, pacman_y)
-        return False
-    
-    # If Pacman is facing West
-    if facing == Directions.WEST:
-        # Check if the object is anywhere due West of Pacman before a
-        # wall intervenes.
-        next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] - 1, pacman_y)
+    graph = layoutGraph(state)
+    if facing not in graph.DIRECTIONS:
         return False
+    d = graph.DIRECTIONS.index(facing)
+    next = graph.successors[4 * graph.cellId(state.getPacmanPosition()) + d]
+    while next >= 0:
+        if graph.cells[next] == object:
+            return True
+        next = graph.successors[4 * next + d]
+    return False
 
 def atSide(object, facing, state):
     # Returns true if the object is in a side corridor perpendicular
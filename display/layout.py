@@ -7,28 +7,116 @@
 
 from game_modules.util import manhattanDistance
 from game_modules.game import Grid
+from game_modules.game import BitGrid
+from game_modules.game import Directions
+from game_modules.game import Actions
+from array import array
 import os
 import random
 from functools import reduce
 
 VISIBILITY_MATRIX_CACHE = {}
+LAYOUT_GRAPH_CACHE = {}
+LAYOUT_CACHE = {}
+
+class LayoutGraph:
+    """
+    The open cells of a layout compiled into integer ids, so consumers can
+    walk the maze without re-reading the wall grid.  Cell i is at cells[i]
+    and index[x * height + y] is the id of (x, y), or -1 for a wall.
+
+    Neighbours are stored CSR-style: the ids next to cell i are
+    neighbours[offsets[i]:offsets[i + 1]], in DIRECTIONS order.
+    successors[4 * i + d] is the id reached from cell i by moving in
+    DIRECTIONS[d], or -1 if that move runs into a wall; d ^ 1 is the
+    opposite direction.
+
+    The graph never changes once built; use Layout.getGraph to share one
+    instance between every layout with the same text.
+    """
+    DIRECTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST)
+
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        height = self.height
+        # asList lists the cells column by column, like the ids
+        self.cells = walls.asList(False)
+        self.index = array('i', [-1]) * (self.width * height)
+        for i, (x, y) in enumerate(self.cells):
+            self.index[x * height + y] = i
+
+        self.offsets = array('i', [0])
+        self.neighbours = array('i')
+        self.successors = array('i', [-1]) * (4 * len(self.cells))
+        # Per-cell answers for Actions.getPossibleActions and Actions.getLegalNeighbors.
+        self.possibleActions = []
+        self.legalNeighbors = []
+        for i, (x, y) in enumerate(self.cells):
+            actions = []
+            for d, direction in enumerate(self.DIRECTIONS):
+                dx, dy = Actions._directions[direction]
+                nextx, nexty = x + dx, y + dy
+                if 0 <= nextx < self.width and 0 <= nexty < height and self.index[nextx * height + nexty] >= 0:
+                    j = self.index[nextx * height + nexty]
+                    self.successors[4 * i + d] = j
+                    self.neighbours.append(j)
+                    actions.append(direction)
+            self.offsets.append(len(self.neighbours))
+            self.possibleActions.append(tuple(actions) + (Directions.STOP,))
+            self.legalNeighbors.append(tuple(self.cells[j] for j in self.getNeighbours(i)) + ((x, y),))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def cellId(self, pos):
+        "Returns the id of the cell at pos, or -1 if it is a wall."
+        x, y = pos
+        return self.index[int(x) * self.height + int(y)]
+
+    def getNeighbours(self, cell):
+        "Returns the ids of the open cells next to cell id 'cell'."
+        return self.neighbours[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def getPossibleActions(self, config):
+        "Same as Actions.getPossibleActions for this layout's walls."
+        x, y = config.pos
+        if type(x) is int and type(y) is int:
+            return list(self.possibleActions[self.index[x * self.height + y]])
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+
+        # In between grid points, all agents must continue straight
+        if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
+            return [config.getDirection()]
+        return list(self.possibleActions[self.index[x_int * self.height + y_int]])
+
+    def getLegalNeighbors(self, position):
+        "Same as Actions.getLegalNeighbors for this layout's walls."
+        x, y = position
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+        return list(self.legalNeighbors[self.index[x_int * self.height + y_int]])
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are never changed once built, so game states share them by
+    reference instead of copying them, and getLayout returns the same
+    Layout each time it loads the same maze (see internLayout).
     """
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.walls = BitGrid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.graph = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -55,6 +143,18 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getGraph(self):
+        """
+        Returns the LayoutGraph of this layout, compiled the first time any
+        layout with the same text asks for it.
+        """
+        if self.graph is None:
+            key = str(self)
+            if key not in LAYOUT_GRAPH_CACHE:
+                LAYOUT_GRAPH_CACHE[key] = LayoutGraph(self.walls)
+            self.graph = LAYOUT_GRAPH_CACHE[key]
+        return self.graph
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -84,7 +184,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so a copy can be the layout itself
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -139,5 +240,15 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return internLayout([line.strip() for line in f])
     finally: f.close()
+
+def internLayout(layoutText):
+    """
+    Returns the Layout of layoutText, built the first time any caller asks
+    for a maze with this text and shared from then on.
+    """
+    key = "\n".join(layoutText)
+    if key not in LAYOUT_CACHE:
+        LAYOUT_CACHE[key] = Layout(layoutText)
+    return LAYOUT_CACHE[key]
@@ -9,6 +9,7 @@ from game_modules.util import *
 import time, os
 import traceback
 import sys
+import random
 
 #######################
 # Parts worth reading #
@@ -52,6 +53,19 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
+# Zobrist keys: a random 64-bit number for each feature a game state can have
+# (a piece of food, a capsule, an agent in a cell facing a direction, a scared
+# timer), drawn the first time the feature is seen.  The key of a state is the
+# XOR of the keys of its features (see GameStateData.getKey).
+ZOBRIST_KEYS = {}
+_zobristRandom = random.Random(0)
+
+def zobristKey(feature):
+    key = ZOBRIST_KEYS.get(feature)
+    if key is None:
+        key = ZOBRIST_KEYS[feature] = _zobristRandom.getrandbits(64)
+    return key
+
 class Configuration:
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
@@ -59,7 +73,11 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Positions on grid points are kept as integers; only agents between grid
+    points (half-speed scared ghosts) have float positions.
     """
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -76,7 +94,7 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None: return False
+        if other is None: return False
         return (self.pos == other.pos and self.direction == other.direction)
 
     def __hash__(self):
@@ -100,12 +118,16 @@ class Configuration:
         direction = Actions.vectorToDirection(vector)
         if direction == Directions.STOP:
             direction = self.direction # There is no stop direction
-        return Configuration((x + dx, y+dy), direction)
+        x, y = x + dx, y + dy
+        if (type(x) is not int or type(y) is not int) and x == int(x) and y == int(y):
+            x, y = int(x), int(y)
+        return Configuration((x, y), direction)
 
 class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -122,16 +144,30 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
     def __hash__(self):
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
+    def zobrist( self, index ):
+        """
+        The XOR of the Zobrist keys of this state as agent number index:
+        its position and direction and its scared timer.
+        """
+        key = 0
+        if self.configuration != None:
+            key = zobristKey(('agent', index, self.configuration.pos, self.configuration.direction))
+        if self.scaredTimer:
+            key ^= zobristKey(('scared', index, self.scaredTimer))
+        return key
+
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        state = AgentState.__new__( AgentState )
+        state.start = self.start
         state.configuration = self.configuration
+        state.isPacman = self.isPacman
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
         state.numReturned = self.numReturned
@@ -189,16 +225,21 @@ class Grid:
         return hash(h)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
-        return g
+        return self._withData([x[:] for x in self.data])
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
+        return self._withData(self.data)
+
+    def _withData(self, data):
+        # A grid of the same size around data, without first filling in cells that would be thrown away
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        g.data = data
         return g
 
     def count(self, item =True ):
@@ -259,6 +300,140 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid(Grid):
+    """
+    A Grid of booleans stored as the bits of a single Python int, bit
+    x * height + y holding cell (x, y) (the cell order of Grid.asList and
+    Grid.__hash__).  grid[x][y] reads and writes cells as for a Grid, but:
+
+     - count() is a popcount of the int
+     - copies share the int, which is immutable, so copy() is O(1)
+     - the hash is the hash of the int, the same as a Grid with the same cells
+     - asList() walks the set bits of each column instead of every cell
+
+    Reading a cell from the board-sized int would shift all of it, so the
+    first read splits the int into one int per column, and later reads
+    only shift a column.  Copies share the column list until one of them
+    is written to.  The column views grid[x] are made once per grid.
+
+    Layouts store their walls and food in BitGrids.
+    """
+    def __init__(self, width, height, initialValue=False, bits=0, columns=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self.bits = (1 << (width * height)) - 1 if initialValue else bits
+        self.columns = columns
+        self.sharedColumns = columns is not None
+        self.views = None
+
+    def __getitem__(self, x):
+        views = self.views
+        if views is None:
+            views = self.views = [_BitColumn(self, x) for x in range(self.width)]
+        return views[x]
+
+    def __setitem__(self, x, column):
+        for y, item in enumerate(column):
+            self._set(x, y, item)
+
+    def __iter__(self):
+        return (self[x] for x in range(self.width))
+
+    def _column(self, x):
+        "The bits of column x, bit y holding cell (x, y)."
+        if self.columns is None:
+            mask = (1 << self.height) - 1
+            bits = self.bits
+            self.columns = []
+            for _ in range(self.width):
+                self.columns.append(bits & mask)
+                bits >>= self.height
+        return self.columns[x]
+
+    def _set(self, x, y, item):
+        bit = 1 << (x * self.height + y)
+        self.bits = self.bits | bit if item else self.bits & ~bit
+        if self.columns is not None:
+            if self.sharedColumns:
+                self.columns = list(self.columns)
+                self.sharedColumns = False
+            bit = 1 << y
+            self.columns[x] = self.columns[x] | bit if item else self.columns[x] & ~bit
+
+    @property
+    def data(self):
+        return [[bool(self._column(x) >> y & 1) for y in range(self.height)] for x in range(self.width)]
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return (self.width, self.height, self.bits) == (other.width, other.height, other.bits)
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        if self.columns is not None:
+            self.sharedColumns = True
+        return BitGrid(self.width, self.height, bits=self.bits, columns=self.columns)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        ones = self.bits.bit_count()
+        return ones if item else self.width * self.height - ones
+
+    def asList(self, key=True):
+        full = (1 << self.height) - 1
+        list = []
+        for x in range(self.width):
+            # Walk the set bits of one column at a time; clearing a bit of the whole int would copy all of it
+            bits = self._column(x) if key else ~self._column(x) & full
+            while bits:
+                low = bits & -bits
+                list.append((x, low.bit_length() - 1))
+                bits ^= low
+        return list
+
+class _BitColumn:
+    """ Column x of a BitGrid, so that grid[x][y] works as for a Grid """
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        grid = self.grid
+        if not 0 <= y < grid.height:
+            if not -grid.height <= y < 0: raise IndexError('grid row out of range')
+            y += grid.height
+        columns = grid.columns
+        return bool((columns[self.x] if columns is not None else grid._column(self.x)) >> y & 1)
+
+    def __setitem__(self, y, item):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('grid row out of range')
+        self.grid._set(self.x, y, item)
+
+    def __iter__(self):
+        column = self.grid._column(self.x)
+        return (bool(column >> y & 1) for y in range(self.grid.height))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -357,17 +532,23 @@ class GameStateData:
     """
 
     """
+    __slots__ = ('food', '_foodIndex', 'capsules', 'agentStates', 'layout', '_eaten', 'score', '_key', '_foodEaten',
+                 '_foodAdded', '_capsuleEaten', '_agentMoved', '_lose', '_win', 'scoreChange')
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
             self.food = prevState.food.shallowCopy()
+            self._foodIndex = prevState._foodIndex
             self.capsules = prevState.capsules[:]
             self.agentStates = self.copyAgentStates( prevState.agentStates )
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._key = prevState._key
+        else:
+            self._key = None
 
         self._foodEaten = None
         self._foodAdded = None
@@ -378,9 +559,15 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        """
+        A snapshot of the state for an agent to observe.  Agent states and
+        capsules are copied; the layout is immutable and shared, and the
+        food grid is shared copy-on-write: the rules replace it with a copy
+        before eating food (see PacmanRules.consume), so nothing written to
+        the game's state shows up in the snapshot or the other way round.
+        The cost is independent of the size of the maze.
+        """
         state = GameStateData( self )
-        state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -388,10 +575,7 @@ class GameStateData:
         return state
 
     def copyAgentStates( self, agentStates ):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append( agentState.copy() )
-        return copiedStates
+        return [agentState.copy() for agentState in agentStates]
 
     def __eq__( self, other ):
         """
@@ -399,6 +583,8 @@ class GameStateData:
         """
         if other == None: return False
         # TODO Check for type of other
+        # States with different keys differ, which settles most comparisons at once
+        if self.getKey() != other.getKey(): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -409,13 +595,45 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError(e):
-                print(e)
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return self.getKey()
+
+    def getKey( self ):
+        """
+        The 64-bit Zobrist key of the state: the XOR of the keys of its food,
+        capsules, agent cells and directions and scared timers.  States made
+        by generateSuccessor update their parent's key in O(1) time (see
+        updateKey); any other state computes it on first use.
+        """
+        if self._key is None:
+            self._key = self.computeKey()
+        return self._key
+
+    def computeKey( self ):
+        key = 0
+        for x, y in self.food.asList():
+            key ^= zobristKey(('food', x, y))
+        for x, y in self.capsules:
+            key ^= zobristKey(('capsule', x, y))
+        for index, agentState in enumerate( self.agentStates ):
+            key ^= agentState.zobrist( index )
+        return key
+
+    def updateKey( self, prevState ):
+        """
+        Sets the key of this successor of prevState by XORing out the
+        features that the move changed and XORing in their new values.
+        """
+        key = prevState.getKey()
+        for position in (self._foodEaten, self._foodAdded):
+            if position != None:
+                key ^= zobristKey(('food',) + tuple(position))
+        if self._capsuleEaten != None:
+            key ^= zobristKey(('capsule',) + tuple(self._capsuleEaten))
+        for index, (old, new) in enumerate( zip( prevState.agentStates, self.agentStates ) ):
+            # Moves replace configurations rather than change them, so an unchanged agent keeps the same one
+            if old.configuration is not new.configuration or old.scaredTimer != new.scaredTimer:
+                key ^= old.zobrist( index ) ^ new.zobrist( index )
+        self._key = key
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -474,6 +692,8 @@ class GameStateData:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.food = layout.food.copy()
+        # The positions of the food as a frozenset, kept up to date as food is eaten
+        self._foodIndex = frozenset(self.food.asList())
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -488,6 +708,7 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._key = self.computeKey()
 
 try:
     import boinc
@@ -8,6 +8,8 @@
 import sys
 import inspect
 import heapq, random
+import math
+import collections
 import io 
 
 class FixedRandom:
@@ -129,11 +131,11 @@ class Stack:
 class Queue:
     "A container with a first-in-first-out (FIFO) queuing policy."
     def __init__(self):
-        self.list = []
+        self.list = collections.deque()
 
     def push(self,item):
         "Enqueue the 'item' into the queue"
-        self.list.insert(0,item)
+        self.list.appendleft(item)
 
     def pop(self):
         """
@@ -184,6 +186,224 @@ class PriorityQueue:
         else:
             self.push(item, priority)
 
+class IndexedPriorityQueue:
+    """
+      A priority queue keyed by the item, so each item is held at most once.
+      A dict maps every item to its position in the binary heap, giving O(1)
+      membership and priority lookup and an O(log n) update in place of
+      PriorityQueue's linear scan and heapify.  Items must be hashable.
+      Among equal priorities the item pushed with the larger depth comes out
+      first, then the one inserted first, as in PriorityQueue.
+    """
+    def  __init__(self):
+        self.heap = []
+        self.index = {}
+        self.count = 0
+
+    def push(self, item, priority, depth=0):
+        "Adds 'item', or changes its priority if it is already queued."
+        if item in self.index:
+            position = self.index[item]
+            count = self.heap[position][2]
+            self.heap[position] = (priority, -depth, count, item)
+            self._siftUp(position)
+            self._siftDown(self.index[item])
+            return
+        self.heap.append((priority, -depth, self.count, item))
+        self.index[item] = len(self.heap) - 1
+        self.count += 1
+        self._siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        "Removes and returns the item with the lowest priority."
+        last = self.heap.pop()
+        if not self.heap:
+            del self.index[last[3]]
+            return last[3]
+        item = self.heap[0][3]
+        del self.index[item]
+        self.heap[0] = last
+        self.index[last[3]] = 0
+        self._siftDown(0)
+        return item
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def update(self, item, priority, depth=0):
+        # If item already in priority queue with higher priority, lower its priority.
+        # If item already in priority queue with equal or lower priority, do nothing.
+        # If item not in priority queue, do the same thing as self.push.
+        if item in self.index and self.heap[self.index[item]][0] <= priority:
+            return
+        self.push(item, priority, depth)
+
+    def getPriority(self, item):
+        "Returns the priority 'item' is queued with."
+        return self.heap[self.index[item]][0]
+
+    def peekPriority(self):
+        "Returns the lowest priority in the queue without removing it."
+        return self.heap[0][0]
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _siftUp(self, position):
+        heap, index = self.heap, self.index
+        entry = heap[position]
+        while position > 0:
+            parent = (position - 1) >> 1
+            if heap[parent] <= entry:
+                break
+            heap[position] = heap[parent]
+            index[heap[position][3]] = position
+            position = parent
+        heap[position] = entry
+        index[entry[3]] = position
+
+    def _siftDown(self, position):
+        heap, index = self.heap, self.index
+        size = len(heap)
+        entry = heap[position]
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if entry <= heap[child]:
+                break
+            heap[position] = heap[child]
+            index[heap[position][3]] = position
+            position = child
+        heap[position] = entry
+        index[entry[3]] = position
+
+class BucketQueue:
+    """
+      A priority queue for whole-number priorities (Dial's algorithm).  Items
+      are kept in one bucket per priority, and a pointer to the lowest
+      non-empty bucket only moves forward until something lower is pushed, so
+      push and pop are O(1) apart from skipping empty buckets.  Like
+      IndexedPriorityQueue it is keyed by the item and supports update,
+      membership and priority lookup.
+
+      Within a bucket the largest depth is popped first, most recent first.
+      Searches pass the path cost g as the depth, which breaks ties between
+      equal f values in favour of the deepest state.  Each bucket is itself
+      split into sub-buckets by depth, with a pointer to the deepest one that
+      only moves down until something deeper is pushed, so the tie-break
+      keeps pop O(1) in the same way.
+
+      The first priority or depth that is not a whole number moves every
+      entry into an IndexedPriorityQueue, which serves all later calls.
+    """
+    def  __init__(self):
+        self.buckets = {}
+        self.entries = {}
+        self.minimum = None
+        self.fallback = None
+
+    def push(self, item, priority, depth=0):
+        "Adds 'item', or changes its priority if it is already queued."
+        if self.fallback is None and (priority != int(priority) or depth != int(depth)):
+            self._fallBack()
+        if self.fallback is not None:
+            return self.fallback.push(item, priority, depth)
+        priority, depth = int(priority), int(depth)
+        if item in self.entries:
+            self._remove(item)
+        self.entries[item] = (priority, depth)
+        # A bucket is [deepest, {depth: {item: None}}]; every depth in it is at most deepest
+        bucket = self.buckets.get(priority)
+        if bucket is None:
+            bucket = self.buckets[priority] = [depth, {}]
+        elif depth > bucket[0]:
+            bucket[0] = depth
+        bucket[1].setdefault(depth, {})[item] = None
+        if self.minimum is None or priority < self.minimum:
+            self.minimum = priority
+
+    def pop(self):
+        "Removes and returns an item with the lowest priority."
+        if self.fallback is not None:
+            return self.fallback.pop()
+        bucket = self.buckets[self._lowest()]
+        depths = bucket[1]
+        # Skip down over empty depths, as _lowest skips up over empty buckets
+        while bucket[0] not in depths:
+            bucket[0] -= 1
+        items = depths[bucket[0]]
+        item, _ = items.popitem()
+        if not items:
+            del depths[bucket[0]]
+            if not depths:
+                del self.buckets[self.minimum]
+        del self.entries[item]
+        return item
+
+    def isEmpty(self):
+        if self.fallback is not None:
+            return self.fallback.isEmpty()
+        return len(self.entries) == 0
+
+    def update(self, item, priority, depth=0):
+        # If item already in priority queue with higher priority, lower its priority.
+        # If item already in priority queue with equal or lower priority, do nothing.
+        # If item not in priority queue, do the same thing as self.push.
+        if item in self and self.getPriority(item) <= priority:
+            return
+        self.push(item, priority, depth)
+
+    def getPriority(self, item):
+        "Returns the priority 'item' is queued with."
+        if self.fallback is not None:
+            return self.fallback.getPriority(item)
+        return self.entries[item][0]
+
+    def peekPriority(self):
+        "Returns the lowest priority in the queue without removing it."
+        if self.fallback is not None:
+            return self.fallback.peekPriority()
+        return self._lowest()
+
+    def __contains__(self, item):
+        if self.fallback is not None:
+            return item in self.fallback
+        return item in self.entries
+
+    def __len__(self):
+        if self.fallback is not None:
+            return len(self.fallback)
+        return len(self.entries)
+
+    def _lowest(self):
+        # Skip forward over empty buckets; every queued priority is at least self.minimum.
+        if not self.entries:
+            raise IndexError('pop from an empty priority queue')
+        while self.minimum not in self.buckets:
+            self.minimum += 1
+        return self.minimum
+
+    def _remove(self, item):
+        priority, depth = self.entries.pop(item)
+        depths = self.buckets[priority][1]
+        del depths[depth][item]
+        if not depths[depth]:
+            del depths[depth]
+            if not depths:
+                del self.buckets[priority]
+
+    def _fallBack(self):
+        self.fallback = IndexedPriorityQueue()
+        for item, (priority, depth) in self.entries.items():
+            self.fallback.push(item, priority, depth)
+        self.buckets, self.entries = {}, {}
+
 class PriorityQueueWithFunction(PriorityQueue):
     """
     Implements a priority queue with the same push/pop signature of the
@@ -201,6 +421,82 @@ class PriorityQueueWithFunction(PriorityQueue):
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
 
+"""
+ Trackers of the states explored by GameState.generateSuccessor (see
+ GameState.tracker and pacman.py --explored)
+"""
+
+class ExplorationCounter:
+    """
+      Counts the successors generated, and the distinct states among them and
+      their parents by their hashes.  Keeps one int per distinct state.
+    """
+    exact = True
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        "Forget everything recorded so far"
+        self.generated = 0
+        self.keys = set()
+
+    def record(self, parent, child):
+        "Record that 'child' was generated as a successor of 'parent'"
+        self.generated += 1
+        self.keys.add(hash(parent))
+        self.keys.add(hash(child))
+
+    def uniqueStates(self):
+        return len(self.keys)
+
+class ExplorationEstimator(ExplorationCounter):
+    """
+      Counts the successors generated, and estimates the number of distinct
+      states with a HyperLogLog sketch of 2**precision one-byte registers,
+      so memory stays fixed however many states are seen.  The standard
+      error of the estimate is about 1.04 / sqrt(2**precision), 1.6% for the
+      default precision.
+    """
+    exact = False
+    MASK = (1 << 64) - 1
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        ExplorationCounter.__init__(self)
+
+    def reset(self):
+        self.generated = 0
+        self.registers = bytearray(1 << self.precision)
+
+    def record(self, parent, child):
+        self.generated += 1
+        self.add(hash(parent))
+        self.add(hash(child))
+
+    def add(self, key):
+        "Add a hash to the sketch"
+        # Spread the hash over all 64 bits (the splitmix64 finalizer), as the sketch needs uniform bits
+        key &= self.MASK
+        key = ((key ^ (key >> 30)) * 0xbf58476d1ce4e5b9) & self.MASK
+        key = ((key ^ (key >> 27)) * 0x94d049bb133111eb) & self.MASK
+        key ^= key >> 31
+        # The first bits pick a register, which keeps the longest run of leading zeros seen in the rest
+        bits = 64 - self.precision
+        index = key >> bits
+        rank = bits - (key & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def uniqueStates(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Few states: count the empty registers instead
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
     return abs( xy1[0] - xy2[0] ) + abs( xy1[1] - xy2[1] )
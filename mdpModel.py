@@ -0,0 +1,529 @@
+# mdpModel.py
+# ---------
+
+"""
+The Markov decision process solved by the MDP agents (valueMDPAgents.py and
+policyMDPAgents.py), compiled from a layout's graph, its food and the reward
+settings into flat arrays indexed by state id.
+
+Building a model is the slow part of an agent's startup, so models are cached:
+every agent and every game asking for the same layout, food and rewards shares
+one MDPModel.
+
+Solving a model is slower still, so the solutions the agents find can be
+cached too, in memory and optionally on disk (see loadSolution).  How a
+solver converged can be recorded sweep by sweep in a SolverTrace.
+
+MDPAgent is the base class of the MDP agents: it loads their model, keeps
+their solution cache and traces, and re-plans online as food is eaten.
+"""
+
+from game_modules.game import Agent
+from game_modules.game import Directions
+import api
+import collections
+import csv
+import hashlib
+import json
+import numpy as np
+import os
+import time
+import zipfile
+
+MDP_MODEL_CACHE = {}
+SOLUTION_CACHE = {}
+
+# Changing how solutions are stored must change this, so old files are ignored
+SOLUTION_FORMAT = 1
+
+# Action order of the action axis of MDPModel.nextStates, and the same actions as game directions
+ACTIONS = ('north', 'south', 'east', 'west')
+DIRECTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST)
+
+class MDPModel:
+    """
+    The states are the open cells of the layout: cells[i] is state i and
+    ids[cell] is the id of cell.
+
+    nextStates[i, a] holds the ids of the 3 possible outcomes of taking
+    ACTIONS[a] in state i: the intended move and the 2 sideways moves.  A move
+    into a wall leaves Pacman in state i.  rewards[i] is the reward of state i:
+    emptyReward for a cell without food, foodReward for food with at most 2
+    walls around it and foodReward / (1 + walls^2) for food in a dead end or a
+    corner.  The last piece of food is the terminal state of the game and gets
+    foodReward on top.  isFood marks the states with food, so rewardsFor can
+    give the rewards of other settings without building another model.
+
+    stateMap() gives the transitions as dicts keyed by cell, for the solver
+    that works on dicts; it is only built when asked for.
+
+    A model is shared and must not be changed; copy the rewards before
+    changing them.
+    """
+
+    def __init__(self, graph, food, foodReward, emptyReward=-1):
+        self.foodReward, self.emptyReward = foodReward, emptyReward
+        self.cells = graph.cells
+        self.ids = {cell: i for i, cell in enumerate(self.cells)}
+
+        # The layout graph's successor table, with a move into a wall (-1) replaced by staying in place
+        successors = np.array(graph.successors, dtype=np.intp).reshape(len(self.cells), 4)
+        walls = successors < 0
+        stay = np.arange(len(self.cells))[:, np.newaxis]
+        north, south, east, west = np.where(walls, stay, successors).T
+        self.nextStates = np.stack([np.stack([north, east, west], axis=1),
+                                    np.stack([south, east, west], axis=1),
+                                    np.stack([east, north, south], axis=1),
+                                    np.stack([west, north, south], axis=1)], axis=1)
+
+        # What foodReward is divided by for each piece of food; the last one is also worth foodReward on top
+        self.isFood = np.zeros(len(self.cells), dtype=bool)
+        self.foodDivisor = np.ones(len(self.cells))
+        wallCounts = walls.sum(axis=1).tolist()
+        foodIds = [self.ids[pos] for pos in food]
+        for i in foodIds:
+            count = wallCounts[i]
+            self.isFood[i] = True
+            self.foodDivisor[i] = 1 if count <= 2 else 1 + count * count
+        self.lastFood = foodIds[0] if len(foodIds) == 1 else None
+        self.rewards = self.rewardsFor(foodReward, emptyReward)
+
+        # The strongly connected components and the dict transitions, built by the first call of components() and
+        # stateMap()
+        self.componentList = None
+        self.mappedStates = None
+
+    def __len__(self):
+        return len(self.cells)
+
+    def rewardsFor(self, foodReward, emptyReward):
+        """
+        Returns the reward vector [S] of the same layout and food with other
+        rewards, as the model built with them would have.
+        """
+        rewards = np.where(self.isFood, foodReward / self.foodDivisor, emptyReward)
+        if self.lastFood is not None:
+            rewards[self.lastFood] += foodReward
+        return rewards
+
+    def stateMap(self):
+        """
+        Returns the transitions as a dict keyed by cell: stateMap()[cell][action]
+        is the list of the 3 outcome cells of taking action (a name in ACTIONS)
+        in cell.  It is built by the first call and shared.
+        """
+        if self.mappedStates is None:
+            cells = self.cells
+            self.mappedStates = {cell: {action: [cells[next] for next in outcomes]
+                                        for action, outcomes in zip(ACTIONS, actions)}
+                                 for cell, actions in zip(cells, self.nextStates.tolist())}
+        return self.mappedStates
+
+    def expectedUtilities(self, utils, actionProb, otherActionProb):
+        """
+        Returns the [S, 4] array of the expected utility of the next state
+        for every action of every state, given the utilities utils [S].
+        Utilities [K, S] for K settings give an array [K, S, 4].
+        """
+        return actionProb * utils[..., self.nextStates[:, :, 0]] + otherActionProb * \
+            utils[..., self.nextStates[:, :, 1]] + otherActionProb * utils[..., self.nextStates[:, :, 2]]
+
+    def successors(self):
+        """
+        Returns, for every state id, the sorted list of the other states that
+        one of its actions can lead to.
+        """
+        return [sorted(set(outcomes) - {s}) for s, outcomes in
+                enumerate(self.nextStates.reshape(len(self.cells), 12).tolist())]
+
+    def components(self):
+        """
+        Returns the strongly connected components of the transition graph as
+        lists of state ids, in reverse topological order: no state has a
+        transition into a component listed after its own.  This is Tarjan's
+        algorithm, with an explicit stack so large mazes do not hit the
+        recursion limit.  They are found once per model; the lists are shared
+        and must not be changed.
+        """
+        if self.componentList is None:
+            self.componentList = self.findComponents()
+        return self.componentList
+
+    def findComponents(self):
+        """ Tarjan's algorithm for components() """
+        successors = self.successors()
+        index = [-1] * len(successors)
+        low = [0] * len(successors)
+        onStack = [False] * len(successors)
+        stack, components, count = [], [], 0
+        for root in range(len(successors)):
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = count
+            count += 1
+            stack.append(root)
+            onStack[root] = True
+            work = [(root, 0)]
+            while work:
+                v, i = work[-1]
+                if i < len(successors[v]):
+                    work[-1] = (v, i + 1)
+                    w = successors[v][i]
+                    if index[w] < 0:
+                        index[w] = low[w] = count
+                        count += 1
+                        stack.append(w)
+                        onStack[w] = True
+                        work.append((w, 0))
+                    elif onStack[w]:
+                        low[v] = min(low[v], index[w])
+                    continue
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        onStack[w] = False
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+        return components
+
+    def distances(self, sources):
+        """
+        Returns the number of moves from every state to the nearest of the
+        state ids in sources, or -1 for states that cannot reach any.
+        """
+        successors = self.successors()
+        distance = [-1] * len(successors)
+        queue = collections.deque(sources)
+        for s in sources:
+            distance[s] = 0
+        while queue:
+            s = queue.popleft()
+            # Moves are reversible, so the states s leads to are the states that lead to s
+            for next in successors[s]:
+                if distance[next] < 0:
+                    distance[next] = distance[s] + 1
+                    queue.append(next)
+        return distance
+
+    def greedyActions(self, utils, actionProb, otherActionProb):
+        """
+        Returns the action table of utils: a uint8 array [S] holding the
+        index into ACTIONS of the action with the maximum expected utility
+        in each state, or [K, S] for utilities [K, S].  Ties go to the
+        first action in ACTIONS order.
+        """
+        return self.expectedUtilities(utils, actionProb, otherActionProb).argmax(axis=-1).astype(np.uint8)
+
+def getModel(state, foodReward, emptyReward=-1):
+    """
+    Returns the MDPModel of the layout and food in state with the given
+    rewards, compiled the first time any agent asks for it.
+    """
+
+    graph = api.layoutGraph(state)
+    food = api.foodSet(state)
+    key = (graph, food, foodReward, emptyReward)
+    if key not in MDP_MODEL_CACHE:
+        MDP_MODEL_CACHE[key] = MDPModel(graph, food, foodReward, emptyReward)
+    return MDP_MODEL_CACHE[key]
+
+def batchValueIteration(model, rewards, gammas, errors, actionProb, otherActionProb):
+    """
+    Value iteration of K settings of the same layout at once: rewards is a
+    [K, S] array of the reward vectors of the settings, and gammas and
+    errors hold their discount factors and convergence errors.
+
+    Every setting runs the sweeps of ValueMDPAgent.vectorValueIteration
+    from zero utilities and stops at its own error, so it takes the same
+    number of sweeps to the same utilities as solving it alone.  A sweep
+    backs up all settings that have not converged yet with a few NumPy
+    operations on [K, S, 4] arrays.
+
+    Returns (utils [K, S], actions [K, S], sweeps [K], times [K]), where
+    actions are the greedy action tables and times the seconds after which
+    each setting converged.
+    """
+
+    rewards = np.asarray(rewards, dtype=float)
+    gammas = np.asarray(gammas, dtype=float)
+    errors = np.asarray(errors, dtype=float)
+    utils = np.zeros(rewards.shape)
+    sweeps = np.zeros(len(rewards), dtype=int)
+    times = np.zeros(len(rewards))
+    active = np.arange(len(rewards))
+    startTime = time.time()
+
+    while len(active):
+        current = utils[active]
+        newUtils = (rewards[active][:, :, np.newaxis] + gammas[active][:, np.newaxis, np.newaxis] *
+                    model.expectedUtilities(current, actionProb, otherActionProb)).max(axis=2)
+        delta = np.abs(newUtils - current).max(axis=1)
+        utils[active] = newUtils
+        sweeps[active] += 1
+        converged = delta < errors[active]
+        times[active[converged]] = time.time() - startTime
+        active = active[~converged]
+
+    return utils, model.greedyActions(utils, actionProb, otherActionProb), sweeps, times
+
+def solutionKey(state, parameters):
+    """
+    Returns the key of the solution for the layout and food in state, found
+    by a solver with the given parameters: a tuple of everything else the
+    solution depends on, such as the solver, gamma, error and rewards.  Any
+    change to the layout text, the food or a parameter changes the key.
+    """
+
+    text = repr((SOLUTION_FORMAT, str(state.data.layout), sorted(api.foodSet(state)), parameters))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def loadSolution(key, size, directory=None):
+    """
+    Returns the cached solution (utilities, action table) with the given
+    key, as arrays [size] indexed by state id, or None if there is none.
+    Solutions are looked up in memory first, then in directory if it is
+    given.  A file that cannot be read or does not fit the model is ignored.
+    """
+
+    if key not in SOLUTION_CACHE and directory:
+        try:
+            with np.load(os.path.join(directory, key + '.npz')) as data:
+                utils, actions = data['utils'], data['actions']
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        if utils.shape != (size,) or actions.shape != (size,) or actions.dtype != np.uint8:
+            return None
+        SOLUTION_CACHE[key] = (utils, actions)
+    if key not in SOLUTION_CACHE:
+        return None
+    utils, actions = SOLUTION_CACHE[key]
+    return utils.copy(), actions.copy()
+
+def saveSolution(key, utils, actions, directory=None):
+    """
+    Caches the solution (utilities, action table) with the given key in
+    memory and, if directory is given, in directory/<key>.npz.  The file is
+    written under a temporary name and then renamed, so concurrent runs
+    never read a partly written solution.
+    """
+
+    SOLUTION_CACHE[key] = (np.array(utils, dtype=float), np.array(actions, dtype=np.uint8))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key + '.npz')
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as f:
+            np.savez(f, utils=SOLUTION_CACHE[key][0], actions=SOLUTION_CACHE[key][1])
+        os.replace(temporary, path)
+
+class SolverTrace:
+    """
+    The convergence of one solve, recorded sweep by sweep.  Each entry of
+    sweeps is a dict with:
+        sweep: the number of the sweep, from 1
+        residual: the largest change of a utility during the sweep.  For
+            prioritized sweeping, which has no sweeps, an entry is recorded
+            every S backups with the largest residual bound instead
+        statesChanged: the number of states whose utility changed by at
+            least threshold since the previous sweep
+        policyChanges: the number of states whose greedy action changed
+        backups: the state backups the solver had done by the end of it
+        elapsed: the seconds since the solve started
+    For the first sweep, changes are counted against the starting
+    utilities and policy given to the constructor.
+
+    game and solve say which game of the run, and which solve of that game,
+    the trace belongs to; online re-planning solves more than once a game.
+    """
+    FIELDS = ('sweep', 'residual', 'statesChanged', 'policyChanges', 'backups', 'elapsed')
+
+    def __init__(self, solver, utils, actions, threshold, game=1, solve=1):
+        self.solver = solver
+        self.states = len(utils)
+        self.threshold = threshold
+        self.game = game
+        self.solve = solve
+        self.sweeps = []
+        self.utils = np.array(utils, dtype=float)
+        self.actions = np.array(actions, dtype=np.uint8)
+        self.startTime = time.time()
+
+    def record(self, residual, utils, actions, backups):
+        """
+        Adds a sweep that ended with the utilities utils and the greedy
+        action table actions.  A residual of None is measured as the largest
+        change of a utility since the previous sweep.
+        """
+        utils = np.asarray(utils, dtype=float)
+        if residual is None:
+            residual = np.abs(utils - self.utils).max() if len(utils) else 0
+        self.sweeps.append({'sweep': len(self.sweeps) + 1,
+                            'residual': float(residual),
+                            'statesChanged': int((np.abs(utils - self.utils) >= self.threshold).sum()),
+                            'policyChanges': int((actions != self.actions).sum()),
+                            'backups': int(backups),
+                            'elapsed': time.time() - self.startTime})
+        self.utils = utils.copy()
+        self.actions = np.array(actions, dtype=np.uint8)
+
+    def asDict(self):
+        return {'game': self.game, 'solve': self.solve, 'solver': self.solver, 'states': self.states,
+                'sweeps': self.sweeps}
+
+def writeTraces(traces, path):
+    """
+    Writes the SolverTraces in traces to path: as CSV, one row per sweep
+    with the game, solve, solver and number of states in front, if path
+    ends with .csv, and as a JSON list of SolverTrace.asDict() otherwise.
+    """
+
+    with open(path, 'w', newline='') as f:
+        if path.lower().endswith('.csv'):
+            writer = csv.writer(f)
+            writer.writerow(('game', 'solve', 'solver', 'states') + SolverTrace.FIELDS)
+            for trace in traces:
+                for sweep in trace.sweeps:
+                    writer.writerow([trace.game, trace.solve, trace.solver, trace.states] +
+                                    [sweep[field] for field in SolverTrace.FIELDS])
+        else:
+            json.dump([trace.asDict() for trace in traces], f, indent=1)
+
+class MDPAgent(Agent):
+    """
+    What the MDP agents share: the model of the layout, online re-planning,
+    the solution cache and solver traces.  A subclass sets the solver's
+    hyper-parameters (error, gamma, actionProb, otherActionProb and the
+    rewards) and defines solve(state), which solves the model from
+    self.utils, stopping early once outOfTime(); solutionParameters(),
+    everything else its solutions depend on; and initializeReward(state).
+    """
+
+    def __init__(self, online=False, budget=0.05, cache='', trace=''):
+        # Online re-planning:
+        self.online = str(online).lower() in ('1', 'true')  # re-solve when food is eaten, warm-started
+        self.budget = float(budget)                   # time budget of an online re-solve, in seconds per move
+        self.deadline = None                          # time.time() at which the solver must stop, None for no limit
+        self.food = frozenset()                       # food left at the last move
+
+        # Solution cache: '' solves every game, 'memory' reuses solutions within this run, and any other value is a
+        # directory where solutions are also stored for later runs
+        self.cache = cache
+
+        # Convergence telemetry: with trace set to a path ending in .json or .csv, every solve is recorded sweep by
+        # sweep in self.traces, which are written there at the end of each game
+        self.tracePath = trace
+        self.traces = []                              # SolverTraces of every solve of the run
+        self.trace = None                             # SolverTrace of the running solve, None when not tracing
+        self.games = 0                                # games started in this run
+
+    def loadModel(self, state):
+        """
+        Load the shared MDPModel of this layout (see MDPModel):
+            self.cells: the state at each id, and self.ids: the id of each state
+            self.nextStates: int array [S, 4, 3], the ids of the intended and the 2 sideways outcomes of each
+                action (north, south, east, west)
+            self.rewards: float array [S], the reward of each state
+        The rewards change as food is eaten, so the agent keeps its own copy of them.
+        """
+
+        model = getModel(state, self.food_reward)
+        self.model = model
+        self.cells, self.ids = model.cells, model.ids
+        self.nextStates = model.nextStates
+        self.rewards = model.rewards.copy()
+
+    def replan(self, state):
+        """
+        If food was eaten since the last move, update its reward and re-solve from the current utilities.
+        Returns whether it re-solved.
+        """
+
+        eaten = self.eatenFood(state)
+        if not eaten:
+            return False
+        for food in eaten:
+            self.rewards[self.ids[food]] = self.model.emptyReward
+        if len(self.food) == 1:
+            # The last piece of food is the terminal state and gets the bonus the model gives it
+            self.rewards[self.ids[next(iter(self.food))]] += self.model.foodReward
+        self.deadline = time.time() + self.budget
+        self.solve(state)
+        self.deadline = None
+        return True
+
+    def eatenFood(self, state):
+        """ Food eaten since the last call, found by comparing api's food index with the food left at that call """
+
+        food = api.foodSet(state)
+        if len(food) == len(self.food):
+            return []
+        eaten = self.food - food
+        self.food = food
+        return eaten
+
+    def outOfTime(self):
+        """ True once a solve has used up its time budget """
+
+        return self.deadline is not None and time.time() > self.deadline
+
+    def loadSolution(self, state):
+        """ Load self.utils and self.actionTable from the solution cache; False if caching is off or none is cached """
+
+        if not self.cache:
+            return False
+        solution = loadSolution(self.solutionKey(state), len(self.cells), self.cacheDirectory())
+        if solution is None:
+            return False
+        utils, self.actionTable = solution
+        self.utils = dict(zip(self.cells, utils.tolist()))
+        return True
+
+    def saveSolution(self, state):
+        """ Store self.utils and self.actionTable in the solution cache, if caching is on """
+
+        if self.cache:
+            utils = [self.utils[cell] for cell in self.cells]
+            saveSolution(self.solutionKey(state), utils, self.actionTable, self.cacheDirectory())
+
+    def cacheDirectory(self):
+        return None if self.cache == 'memory' else self.cache
+
+    def solutionKey(self, state):
+        return solutionKey(state, self.solutionParameters())
+
+    def startTrace(self, solver, actions=None):
+        """
+        Start recording a solve from the current utilities and the policy actions (by default the greedy policy
+        of the utilities) in a new SolverTrace, if tracing is on.
+        """
+
+        self.trace = None
+        if self.tracePath:
+            utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+            if actions is None:
+                actions = self.model.greedyActions(utils, self.actionProb, self.otherActionProb)
+            solve = sum(trace.game == self.games for trace in self.traces) + 1
+            self.trace = SolverTrace(solver, utils, actions, self.error, self.games, solve)
+            self.traces.append(self.trace)
+
+    def recordSweep(self, residual, utils, actions=None):
+        """ Add a sweep that ended with utils (in state id order) and actions to the running trace, if any """
+
+        if self.trace is not None:
+            utils = np.asarray(utils, dtype=float)
+            if actions is None:
+                actions = self.model.greedyActions(utils, self.actionProb, self.otherActionProb)
+            self.trace.record(residual, utils, actions, self.backups)
+
+    def writeTrace(self):
+        """ Write the traces of the run so far to the trace path, if tracing is on """
+
+        if self.tracePath:
+            writeTraces(self.traces, self.tracePath)
+            print('Solver trace: %s' % self.tracePath)
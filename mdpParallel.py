@@ -0,0 +1,257 @@
+# mdpParallel.py
+# ---------
+
+"""
+Value iteration split over processes, for layouts with so many open cells
+that a single process is the bottleneck (ValueMDPAgent -a solver=tiled).
+
+The states are cut into tiles: runs of whole columns of the maze, which are
+runs of state ids because the layout graph numbers cells column by column.
+Each tile also reads a halo of ghost cells, the states outside it that its
+moves can reach.  The utilities live in shared memory in two buffers; a
+sweep reads one and writes the other, so every tile backs up from the same
+utilities, exactly like a sweep of ValueMDPAgent.vectorValueIteration, and
+the solve takes the same sweeps to the same fixed point.  Between sweeps
+each tile gathers the new values of its halo from the buffer just written.
+
+The worker processes live as long as the TiledSolver and wait on a barrier
+between sweeps, so a sweep costs two barrier waits rather than sending
+tasks and results between processes, and re-solving the same model (as
+online re-planning does) reuses them.  Parallel sweeps only pay off with
+several cores and many states; measure on the machine at hand with
+
+> python mdpParallel.py --size 300 --workers 1,2,4
+"""
+
+from multiprocessing import shared_memory
+from optparse import OptionParser
+import display.layout as layout
+import mdpModel
+import multiprocessing
+import numpy as np
+import sys
+import time
+
+# Seconds a process waits for the others at a barrier before giving up, so a crashed worker raises an error
+BARRIER_TIMEOUT = 60
+
+# Commands the solver gives its workers at the start barrier
+SWEEP, STOP = 0, 1
+
+def partition(cells, tiles):
+    """
+    Splits the state ids of cells (ordered column by column, as in a
+    LayoutGraph) into at most 'tiles' runs of whole columns of about the
+    same size.  Returns the runs as (first, last + 1) pairs.
+    """
+
+    xs = np.array([x for x, y in cells])
+    bounds = [0]
+    for t in range(1, tiles):
+        # Move the cut forward to the start of the next column
+        cut = max(t * len(cells) // tiles, bounds[-1] + 1)
+        while cut < len(cells) and xs[cut] == xs[cut - 1]:
+            cut += 1
+        if cut < len(cells):
+            bounds.append(cut)
+    bounds.append(len(cells))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+class Tile:
+    """
+    The states first <= id < last, and what a worker needs to back them up:
+    ids is the sorted array of the tile's states plus its halo, start is
+    the position of the tile's first state in ids, and nextStates is the
+    tile's [n, 4, 3] successor table as positions in ids.
+    """
+
+    def __init__(self, first, last, nextStates):
+        self.first, self.last = first, last
+        tileNext = nextStates[first:last]
+        halo = np.setdiff1d(tileNext, np.arange(first, last))
+        self.ids = np.union1d(np.arange(first, last), halo)
+        self.start = int(np.searchsorted(self.ids, first))
+        self.nextStates = np.searchsorted(self.ids, tileNext)
+
+    def sweep(self, previous, target, rewards, gamma, actionProb, otherActionProb):
+        """ Backs up the tile from the utilities previous into target; returns the largest change """
+
+        # Gather the tile and its halo
+        utils = previous[self.ids]
+        next = self.nextStates
+        newUtils = (rewards[self.first:self.last, np.newaxis] + gamma * (
+                actionProb * utils[next[:, :, 0]] + otherActionProb *
+                utils[next[:, :, 1]] + otherActionProb * utils[next[:, :, 2]])).max(axis=1)
+        own = utils[self.start:self.start + len(newUtils)]
+        target[self.first:self.last] = newUtils
+        return float(np.abs(newUtils - own).max()) if len(newUtils) else 0.0
+
+def sharedArrays(memory, size, tiles):
+    """
+    The arrays in the solver's shared memory: the utility buffers [2, size],
+    the rewards [size], the largest change of each tile in the last sweep
+    [tiles] and the control words [2]: the command and the buffer to read.
+    """
+
+    buffers = np.ndarray((2, size), dtype=float, buffer=memory.buf)
+    rewards = np.ndarray(size, dtype=float, buffer=memory.buf, offset=2 * size * 8)
+    deltas = np.ndarray(tiles, dtype=float, buffer=memory.buf, offset=3 * size * 8)
+    control = np.ndarray(2, dtype=np.int64, buffer=memory.buf, offset=(3 * size + tiles) * 8)
+    return buffers, rewards, deltas, control
+
+def _work(name, size, tiles, mine, barrier, gamma, actionProb, otherActionProb):
+    """ A worker process: sweeps the tiles numbered in mine whenever the solver asks, until it stops it """
+
+    memory = shared_memory.SharedMemory(name=name)
+    buffers, rewards, deltas, control = sharedArrays(memory, size, len(tiles))
+    try:
+        while True:
+            barrier.wait()
+            if control[0] == STOP:
+                break
+            source = int(control[1])
+            for t in mine:
+                deltas[t] = tiles[t].sweep(buffers[source], buffers[1 - source], rewards, gamma, actionProb,
+                                           otherActionProb)
+            barrier.wait()
+    finally:
+        del buffers, rewards, deltas, control
+        memory.close()
+
+class TiledSolver:
+    """
+    'workers' processes sweeping the tiles of one model, for as many solves
+    of that model as needed.  Load the starting utilities and the rewards
+    of a solve, then sweep until it converges:
+
+        solver = TiledSolver(cells, nextStates, gamma, p, q, tiles, workers)
+        solver.load(utils, rewards)
+        delta = solver.sweep()
+        ...
+        solver.close()
+
+    cells and nextStates describe the model as in mdpModel.MDPModel, and
+    tiles is the number of tiles to cut.  close() stops the processes and
+    releases the shared memory; the solver is also a context manager.
+    """
+
+    def __init__(self, cells, nextStates, gamma, actionProb, otherActionProb, tiles, workers):
+        self.size = len(cells)
+        self.tiles = [Tile(first, last, nextStates) for first, last in partition(cells, tiles)]
+        self.memory = shared_memory.SharedMemory(create=True, size=max(3 * self.size + len(self.tiles) + 2, 1) * 8)
+        self.buffers, self.rewards, self.deltas, self.control = sharedArrays(self.memory, self.size, len(self.tiles))
+        self.source = 0
+
+        # Deal the tiles out to the workers; there is no point in more workers than tiles
+        workers = max(1, min(workers, len(self.tiles)))
+        self.barrier = multiprocessing.Barrier(workers + 1, timeout=BARRIER_TIMEOUT)
+        self.processes = [multiprocessing.Process(target=_work, daemon=True, args=(
+            self.memory.name, self.size, self.tiles, list(range(w, len(self.tiles), workers)), self.barrier, gamma,
+            actionProb, otherActionProb)) for w in range(workers)]
+        for process in self.processes:
+            process.start()
+
+    def load(self, utils, rewards):
+        """ Starts a solve from the utilities utils with the given rewards (arrays indexed by state id) """
+
+        self.buffers[0] = utils
+        self.rewards[:] = rewards
+        self.source = 0
+
+    def sweep(self):
+        """ Backs up every state once; returns the largest change of a utility """
+
+        self.control[:] = (SWEEP, self.source)
+        # The workers sweep between the two waits
+        self.barrier.wait()
+        self.barrier.wait()
+        self.source = 1 - self.source
+        return float(self.deltas.max()) if len(self.deltas) else 0.0
+
+    def utils(self):
+        """ A copy of the utilities after the last sweep """
+
+        return self.buffers[self.source].copy()
+
+    def close(self):
+        if self.processes:
+            self.control[0] = STOP
+            try:
+                self.barrier.wait()
+            except Exception:
+                pass
+            for process in self.processes:
+                process.join(BARRIER_TIMEOUT)
+            self.processes = []
+            del self.buffers, self.rewards, self.deltas, self.control
+            self.memory.close()
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def openLayout(size):
+    """ A square layout of size x size open cells inside a wall, with food in every 7th cell """
+
+    rows = ['%' * (size + 2)]
+    for y in range(size):
+        rows.append('%' + ''.join('.' if (x + y * size) % 7 == 0 else ' ' for x in range(size)) + '%')
+    rows.append('%' * (size + 2))
+    rows[1] = '%P' + rows[1][2:]
+    return layout.Layout(rows)
+
+def measure(model, workerCounts, sweeps, gamma=0.9, actionProb=0.8):
+    """
+    Times 'sweeps' sweeps of the vectorized Jacobi sweep in this process,
+    and of a TiledSolver with each number of workers in workerCounts (as
+    many tiles as workers).  Returns the seconds per sweep of each, the
+    single process first, and checks that all end with the same utilities.
+    """
+
+    otherActionProb = (1 - actionProb) / 2
+    straight, left, right = model.nextStates[:, :, 0], model.nextStates[:, :, 1], model.nextStates[:, :, 2]
+    reward = model.rewards[:, np.newaxis]
+    utils = np.zeros(len(model))
+    startTime = time.perf_counter()
+    for _ in range(sweeps):
+        utils = (reward + gamma * (actionProb * utils[straight] + otherActionProb * utils[left] +
+                                   otherActionProb * utils[right])).max(axis=1)
+    times = [(time.perf_counter() - startTime) / sweeps]
+
+    for workers in workerCounts:
+        with TiledSolver(model.cells, model.nextStates, gamma, actionProb, otherActionProb, workers,
+                         workers) as solver:
+            solver.load(np.zeros(len(model)), model.rewards)
+            startTime = time.perf_counter()
+            for _ in range(sweeps):
+                solver.sweep()
+            times.append((time.perf_counter() - startTime) / sweeps)
+            if not np.array_equal(solver.utils(), utils):
+                raise Exception('The tiled solver with %d workers differs from the serial sweeps' % workers)
+    return times
+
+if __name__ == '__main__':
+    parser = OptionParser("""
+    USAGE:      python mdpParallel.py <options>
+    EXAMPLES:   python mdpParallel.py --size 300 --workers 1,2,4
+                    - times sweeps of a 300 x 300 open layout in 1 process and with 1, 2 and 4 workers
+    """)
+    parser.add_option('--size', dest='size', type='int', default=300,
+                      help='the width and height of the open layout [Default: 300]')
+    parser.add_option('--workers', dest='workers', default='1,2,4', help='worker counts [Default: 1,2,4]')
+    parser.add_option('--sweeps', dest='sweeps', type='int', default=50, help='sweeps to time [Default: 50]')
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+
+    theLayout = openLayout(options.size)
+    model = mdpModel.MDPModel(theLayout.getGraph(), theLayout.food.asList(), 5)
+    workerCounts = [int(workers) for workers in options.workers.split(',')]
+    times = measure(model, workerCounts, options.sweeps)
+    print('%d states, %d cores' % (len(model), multiprocessing.cpu_count()))
+    print('%-14s %12s %8s' % ('solver', 'ms/sweep', 'speedup'))
+    for name, seconds in zip(['1 process'] + ['%d workers' % w for w in workerCounts], times):
+        print('%-14s %12.3f %8.2f' % (name, seconds * 1000, times[0] / seconds))
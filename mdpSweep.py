@@ -0,0 +1,90 @@
+# mdpSweep.py
+# ---------
+
+"""
+Solves the MDP of one layout for many hyper-parameter settings at once, to
+tune ValueMDPAgent without playing a game per setting.  Every combination of
+the given values is one setting; all of them are solved together by
+mdpModel.batchValueIteration, and the sweeps, solve time and policy of each
+are reported.  For example, to try 3 discount factors with 2 food rewards:
+
+> python mdpSweep.py -l mediumMaze --gamma 0.8,0.9,0.95 --food 5,10
+"""
+
+from optparse import OptionParser
+import display.layout as layout
+import api
+import itertools
+import mdpModel
+import numpy as np
+import pacman
+import sys
+
+def sweep(state, settings, actionProb=api.directionProb):
+    """
+    Solves the layout and food of state for every setting in settings, a
+    list of dicts with the keys gamma, error, food_reward and empty_reward.
+    Returns a list with a copy of each setting, to which are added its
+    utilities and action table (arrays indexed by the model's state ids),
+    the number of sweeps and the solve time.
+    """
+
+    # One model of the layout gives the reward vectors of all settings
+    model = mdpModel.getModel(state, settings[0]['food_reward'], settings[0]['empty_reward'])
+    rewards = np.array([model.rewardsFor(setting['food_reward'], setting['empty_reward']) for setting in settings])
+    utils, actions, sweeps, times = mdpModel.batchValueIteration(
+        model, rewards, [setting['gamma'] for setting in settings], [setting['error'] for setting in settings],
+        actionProb, (1 - actionProb) / 2)
+
+    results = []
+    for k, setting in enumerate(settings):
+        result = dict(setting)
+        result.update(utils=utils[k], actions=actions[k], sweeps=int(sweeps[k]), solveTime=float(times[k]))
+        results.append(result)
+    return results
+
+def readCommand(argv):
+    """ Processes the command used to run mdpSweep from the command line. """
+
+    usageStr = """
+    USAGE:      python mdpSweep.py <options>
+    EXAMPLES:   python mdpSweep.py -l mediumMaze --gamma 0.8,0.9,0.95 --food 5,10
+                    - solves the 6 combinations of gamma and food reward
+    Values are comma separated; the defaults are ValueMDPAgent's settings.
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-l', '--layout', dest='layout', default='mediumMaze',
+                      help='the LAYOUT_FILE to solve [Default: mediumMaze]', metavar='LAYOUT_FILE')
+    parser.add_option('--gamma', dest='gamma', default='0.9', help='discount factors [Default: 0.9]')
+    parser.add_option('--error', dest='error', default='0.001', help='convergence errors [Default: 0.001]')
+    parser.add_option('--food', dest='food', default='5', help='food rewards [Default: 5]')
+    parser.add_option('--empty', dest='empty', default='-1', help='empty cell rewards [Default: -1]')
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    theLayout = layout.getLayout(options.layout)
+    if theLayout == None: raise Exception("The layout " + options.layout + " cannot be found")
+
+    values = [[float(value) for value in option.split(',')]
+              for option in (options.gamma, options.error, options.food, options.empty)]
+    settings = [dict(gamma=gamma, error=error, food_reward=food, empty_reward=empty)
+                for gamma, error, food, empty in itertools.product(*values)]
+    return theLayout, settings
+
+if __name__ == '__main__':
+    theLayout, settings = readCommand(sys.argv[1:])
+    state = pacman.GameState()
+    state.initialize(theLayout, 0)
+    results = sweep(state, settings)
+
+    # The policy of each setting is summed up by Pacman's first move and the states where it differs from the first
+    start = mdpModel.getModel(state, settings[0]['food_reward'], settings[0]['empty_reward']).ids[
+        state.getPacmanPosition()]
+    print('%8s %8s %8s %8s %8s %10s %8s %8s' % ('gamma', 'error', 'food', 'empty', 'sweeps', 'time', 'start',
+                                                 'differs'))
+    for result in results:
+        print('%8g %8g %8g %8g %8d %10.5f %8s %8d' % (
+            result['gamma'], result['error'], result['food_reward'], result['empty_reward'], result['sweeps'],
+            result['solveTime'], mdpModel.DIRECTIONS[result['actions'][start]],
+            (result['actions'] != results[0]['actions']).sum()))
@@ -61,24 +61,20 @@ class GameState:
 
     Note that in classic Pacman, Pacman is always agent 0.
     """
+    __slots__ = ('data',)
 
     ####################################################
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
-    def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
-    getAndResetExplored = staticmethod(getAndResetExplored)
+    # static variable: an optional tracker of the states generateSuccessor explores, such as
+    # util.ExplorationCounter or util.ExplorationEstimator.  None (the default) tracks nothing.
+    tracker = None
 
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
         """
-#        GameState.explored.add(self)
         if self.isWin() or self.isLose(): return []
 
         if agentIndex == 0:  # Pacman is moving
@@ -115,8 +111,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        state.data.updateKey(self.data)
+        if GameState.tracker is not None:
+            GameState.tracker.record(self, state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -180,6 +177,9 @@ class GameState:
 
         currentFood = state.getFood()
         if currentFood[x][y] == True: ...
+
+        The grid is shared with other states (see GameStateData.deepCopy),
+        so copy it before changing it.
         """
         return self.data.food
 
@@ -195,6 +195,13 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getLayoutGraph(self):
+        """
+        Returns the LayoutGraph of the layout: integer cell ids with their
+        neighbours precomputed (see layout.py).
+        """
+        return self.data.layout.getGraph()
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -326,7 +333,7 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        return state.data.layout.getGraph().getPossibleActions( state.getPacmanState().configuration )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
@@ -358,6 +365,7 @@ class PacmanRules:
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
+            state.data._foodIndex = state.data._foodIndex - {position}
             state.data._foodEaten = position
             # TODO: cache numFood?
             numFood = state.getNumFood()
@@ -384,7 +392,7 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+        possibleActions = state.data.layout.getGraph().getPossibleActions( conf )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
             possibleActions.remove( Directions.STOP )
@@ -518,6 +526,9 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--explored', dest='explored', type='choice', choices=['count', 'estimate'],
+                      help='Reports the successor states generated in each game, and how many are distinct: '
+                           'counted exactly (count) or estimated in fixed memory (estimate)', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -527,6 +538,10 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Track the states explored
+    if options.explored == 'count': GameState.tracker = util.ExplorationCounter()
+    if options.explored == 'estimate': GameState.tracker = util.ExplorationEstimator()
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -639,6 +654,11 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         game.run()
         if not beQuiet: games.append(game)
 
+        if GameState.tracker is not None:
+            print('States generated: %d, distinct states: %s%d' % (
+                GameState.tracker.generated, '' if GameState.tracker.exact else '~', GameState.tracker.uniqueStates()))
+            GameState.tracker.reset()
+
         if record:
             import time, cPickle
             fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
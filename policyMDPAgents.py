@@ -2,25 +2,31 @@
 # ---------
 
 from pacman import Directions
-from game_modules.game import Agent
 import api
+import mdpModel
 import numpy as np
 import time
 
-class PolicyMDPAgent(Agent):
-    def __init__(self):
+class PolicyMDPAgent(mdpModel.MDPAgent):
+    solverName = 'Policy Iteration'
+    evaluations = ('iterative', 'exact')
+    denseLimit = 300                                  # largest number of states solved with a dense matrix
+    tieTolerance = 1e-12                              # smallest gain in expected utility that changes the policy
+
+    def __init__(self, evaluation='iterative', online=False, budget=0.05, cache='', trace=''):
+        # Policy evaluation: 'iterative' sweeps until delta < self.error, 'exact' solves the linear system directly
+        if evaluation not in self.evaluations:
+            raise AttributeError(evaluation + ' is not a policy evaluation mode: ' + ', '.join(self.evaluations))
+        self.evaluation = evaluation
+        mdpModel.MDPAgent.__init__(self, online, budget, cache, trace)
+
         # Maps:
-        self.grid = set()                             # a set of all possible states in the game
-        self.mappedStates = {}                        # a dict mapping all possible states to 4 directions
-        self.reward = {}                              # a dict which stores reward of each cell
         self.utils = {}                               # a dict which stores utility of each cell
-        self.possibleActions = {'north', 'south', 'east', 'west'}
-        self.policy = {}
+        self.actionTable = np.zeros(0, dtype=np.uint8)  # the policy: an index into mdpModel.ACTIONS per state id
         self.cost = 0
+        self.backups = 0                              # state backups done by the solver
 
         # Hyper-parameters:
-        self.width = 0                                # width of the game map
-        self.height = 0                               # height of the game map
         self.error = 0.001                            # error for convergence
         self.gamma = 0.9                              # discount factor
         self.actionProb = api.directionProb           # non-deterministic probability of policy: 0.8
@@ -33,31 +39,35 @@ class PolicyMDPAgent(Agent):
     # Gets run after an MDPAgent object is created and once there is
     # game state to access.
     def registerInitialState(self, state):
-        print("Running Policy Iteration MDPAgent!")
+        print("Running %s MDPAgent!" % self.solverName)
         self.startState = state.getPacmanPosition()
         startTime = time.time()
-        # Create a set of all states of the game                         -> self.grid
-        self.makeGrid(state)
+        self.games += 1
         # Initialize rewards values based on the size of the map         -> self.xxx_reward and hyper-parameters
         self.initializeReward(state)
-        # Initialize rewards of each state (except for walls)            -> self.reward (dict)
-        self.updateReward(state)
-        # Initialize all grids' utility to 0                             -> self.utility (dict)
-        self.resetUtility(state)
-        # Map Pacman's all possible states to its 4 adjacent directions  -> self.mappedStates
-        self.mapState(state)
-        # Create a basic policy of always go west
-        self.initializePolicy(state)  
-        self.policyIteration(state)
+        # Load the states, transitions and rewards of the layout         -> self.cells, self.nextStates, ...
+        self.loadModel(state)
+        # Initialize all grids' utility to 0                             -> self.utils (dict)
+        self.utils = dict.fromkeys(self.cells, 0)
+        self.food = api.foodSet(state)
+        # Solve, or load the solution of an earlier game with the same layout and parameters
+        if not self.loadSolution(state):
+            # Create a basic policy of always go west
+            self.initializePolicy(state)
+            self.policyIteration(state)
+            self.saveSolution(state)
         self.timeTaken = (time.time() - startTime)
 
     def final(self, state):
         print("Maze Solved.")
         print('Cost: %.0f' % (self.cost))
         print('Time to find optimal path: %.5f seconds' % self.timeTaken)
-        print('Nodes Visited: %.0f' % (len(self.mappedStates)))
-    
+        print('Nodes Visited: %.0f' % (len(self.cells)))
+        self.writeTrace()
+
     def getAction(self, state):
+        if self.online:
+            self.replan(state)
         policy = self.getPolicy(state)
         legal = api.legalActions(state)
         self.cost += 1
@@ -65,121 +75,144 @@ class PolicyMDPAgent(Agent):
             legal.remove(Directions.STOP)
         return api.makeMove(policy, legal)
 
+    def solve(self, state):
+        self.policyIteration(state)
+
     def policyIteration(self, state):
-        states = self.mappedStates   
-        policy = self.policy
+        actions = self.actionTable
+        rows = np.arange(len(self.cells))
+        self.backups = 0
+        self.startTrace('policy iteration (%s)' % self.evaluation, actions)
 
         while True:
-            policyUtils=self.evaluatePolicy(state,policy)
+            policyUtils = self.evaluatePolicy(state, actions)
             # print("Evaluated Policy: {}".format(policyUtils))
-            policy_stable = True
-            for s in states:
-                tempPolicy = policy[s]
-                # print("Starting one step look ahead")
-                bestPolicy = self.oneStepLookAhead(state, s, policyUtils)
-                # print("Temp Policy: {}".format(tempPolicy))
-                # print("Best Policy: {}".format(bestPolicy))
-                if tempPolicy != bestPolicy:
-                    policy_stable = False
-                    policy[s]=bestPolicy
-            if policy_stable:
-                self.utils=policyUtils
-                self.policy=policy
+            # Greedy improvement of every state at once
+            utils = np.array([policyUtils[cell] for cell in self.cells], dtype=float)
+            expected = self.model.expectedUtilities(utils, self.actionProb, self.otherActionProb)
+            bestActions = expected.argmax(axis=1).astype(np.uint8)
+            improved = bestActions != actions
+            if self.evaluation == 'exact':
+                # With exact evaluation, only switch for a real gain: equally good actions differ by round-off and
+                # switching between them would never let the policy settle.
+                improved &= expected[rows, bestActions] > expected[rows, actions] + self.tieTolerance
+            policy_stable = not improved.any()
+            actions = np.where(improved, bestActions, actions)
+            self.recordSweep(None, utils, actions)
+            if policy_stable or self.outOfTime():
+                self.utils = policyUtils
+                self.actionTable = actions
                 break
 
-    def evaluatePolicy(self, state, policy):
-        states = self.mappedStates
-        reward = self.reward
-        policyUtils=self.utils
+    def evaluatePolicy(self, state, actions):
+        if self.evaluation == 'exact':
+            return self.solvePolicy(state, actions)
+        return self.sweepPolicy(state, actions)
+
+    def sweepPolicy(self, state, actions):
+        """
+            Iterative policy evaluation: in-place sweeps of U = p * (R + gamma * P_policy U) in state id order, with
+            the policy's outcomes read from self.nextStates, until no utility changes by more than self.error.
+        """
+
+        rewards = self.rewards.tolist()
+        policyStates = self.nextStates[np.arange(len(self.cells)), actions].tolist()
+        policyUtils = [self.utils[cell] for cell in self.cells]
 
         while True:
             delta = 0
-            for state, action in policy.items():
-                # print("Evaluating State: {}".format(state))
-                # print("Evaluating Action: {}".format(action))
-                currentReward = reward[state] 
-                next_states = states[state][action]
-                # print("Next States: {}".format(next_states))
-                # print("Policy Utility: {}".format(policyUtils))
-                tempUtil = self.actionProb * (currentReward + self.gamma * (
-                    self.actionProb * policyUtils[next_states[0]] + self.otherActionProb *
-                    policyUtils[next_states[1]] + self.otherActionProb * policyUtils[next_states[2]]))
-                delta = max(delta, np.abs(tempUtil - policyUtils[state]))
-                policyUtils[state] = tempUtil
-                # print("Policy Utility for this state: {}".format(policyUtils[state]))
-            if delta < self.error:
+            for s, (straight, left, right) in enumerate(policyStates):
+                tempUtil = self.actionProb * (rewards[s] + self.gamma * (
+                    self.actionProb * policyUtils[straight] + self.otherActionProb *
+                    policyUtils[left] + self.otherActionProb * policyUtils[right]))
+                delta = max(delta, abs(tempUtil - policyUtils[s]))
+                policyUtils[s] = tempUtil
+            self.backups += len(policyStates)
+            if delta < self.error or self.outOfTime():
                 break
-        return policyUtils
-
-    def oneStepLookAhead(self, state, coord, utils):
-        # choose a direction which returns a maximum expected utility
-        (x, y) = coord
-        walls = api.walls(state) 
-        north = (x, y+1)
-        south = (x, y-1)
-        east = (x+1, y)
-        west = (x-1, y)
-
-        # check if the next location is a wall, if its a wall, stop; otherwise, go
-        if north in walls:
-            north = coord
-        if south in walls:
-            south = coord
-        if east in walls:
-            east = coord
-        if west in walls:
-            west = coord
-
-        # calculate expected utility without reward, since reward is the same
-        North_EU = self.actionProb * utils[north] + \
-                   self.otherActionProb * utils[west] + \
-                   self.otherActionProb * utils[east]
-        South_EU = self.actionProb * utils[south] + \
-                   self.otherActionProb * utils[west] + \
-                   self.otherActionProb * utils[east]
-        East_EU = self.actionProb * utils[east] + \
-                  self.otherActionProb * utils[north] + \
-                  self.otherActionProb * utils[south]
-        West_EU = self.actionProb * utils[west] + \
-                  self.otherActionProb * utils[north] + \
-                  self.otherActionProb * utils[south]
-
-        # get the index of max expected utility
-        list = [North_EU, South_EU, East_EU, West_EU]
-        maxIndex = 0
-        for i in range(len(list)):
-            if list[i] > list[maxIndex]:
-                maxIndex = i
-
-        # return direction: 0-north  1-south  2-east  3-west
-        if maxIndex == 0:
-            return "north"
-        if maxIndex == 1:
-            return "south"
-        if maxIndex == 2:
-            return "east"
-        if maxIndex == 3:
-            return "west"
+        self.utils = dict(zip(self.cells, policyUtils))
+        return self.utils
+
+    def solvePolicy(self, state, actions):
+        """
+            Exact policy evaluation. The fixed point sweepPolicy converges to is
+                U = p * (R + gamma * P_policy U)        (p = self.actionProb)
+            so U solves the linear system (I - p * gamma * P_policy) U = p * R. P_policy has at most 3 entries per row,
+            read from self.nextStates. Small mazes are solved densely with np.linalg.solve; larger ones with
+            bicgstab, warm-started from the previous policy's utilities.
+        """
+
+        nextStates = self.nextStates[np.arange(len(self.cells)), actions]
+        probs = np.array([self.actionProb, self.otherActionProb, self.otherActionProb])
+        scale = self.actionProb * self.gamma
+        b = self.actionProb * self.rewards
+
+        if len(self.cells) <= self.denseLimit:
+            A = np.eye(len(self.cells))
+            rows = np.arange(len(self.cells))
+            for k in range(3):
+                np.add.at(A, (rows, nextStates[:, k]), -scale * probs[k])
+            utils = np.linalg.solve(A, b)
+        else:
+            guess = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+            utils = self.bicgstab(nextStates, scale * probs, b, guess)
+        self.utils = dict(zip(self.cells, utils.tolist()))
+        return self.utils
+
+    def bicgstab(self, nextStates, weights, b, x, tolerance=1e-14, maxIterations=1000):
+        """
+            Solve (I - sum_k weights[k] * P_k) x = b with BiCGSTAB, where P_k picks column nextStates[:, k] in each
+            row. The matrix is never built: a product is 3 gathers. Jacobi preconditioning divides by the diagonal,
+            which is below 1 wherever a move bounces off a wall back into the same cell.
+        """
+
+        def multiply(v):
+            return v - weights[0] * v[nextStates[:, 0]] - weights[1] * v[nextStates[:, 1]] \
+                - weights[2] * v[nextStates[:, 2]]
+
+        rows = np.arange(len(b))
+        diagonal = 1 - ((nextStates == rows[:, np.newaxis]) * weights).sum(axis=1)
+        bound = tolerance * max(np.linalg.norm(b), 1)
+
+        r = b - multiply(x)
+        shadow = r.copy()
+        rho = alpha = omega = 1.0
+        v = p = np.zeros_like(b)
+        for _ in range(maxIterations):
+            if np.linalg.norm(r) <= bound:
+                break
+            rhoNext = shadow.dot(r)
+            if rhoNext == 0:
+                break
+            p = r + (rhoNext / rho) * (alpha / omega) * (p - omega * v)
+            rho = rhoNext
+            y = p / diagonal
+            v = multiply(y)
+            alpha = rho / shadow.dot(v)
+            h = x + alpha * y
+            s = r - alpha * v
+            if np.linalg.norm(s) <= bound:
+                return h
+            z = s / diagonal
+            t = multiply(z)
+            omega = t.dot(s) / t.dot(t)
+            x = h + omega * z
+            r = s - omega * t
+        return x
+
+    def solutionParameters(self):
+        """ Everything besides the layout and food that the solution depends on """
+
+        return (type(self).__name__, self.evaluation, self.gamma, self.error, self.actionProb, self.food_reward,
+                self.tieTolerance, self.denseLimit)
 
     def getPolicy(self, state):
-        # choose a direction which returns a maximum expected utility
-        pacman = api.whereAmI(state)
-        policy = self.policy
-        
-        if policy[pacman] == "north":
-            return Directions.NORTH
-        if policy[pacman] == "south":
-            return Directions.SOUTH
-        if policy[pacman] == "east":
-            return Directions.EAST
-        if policy[pacman] == "west":
-            return Directions.WEST
-        
+        # the direction the policy takes in Pacman's state, looked up in the action table
+        return mdpModel.DIRECTIONS[self.actionTable[self.ids[api.whereAmI(state)]]]
+
     def initializePolicy(self, state):
-        policy = {}
-        for s in self.mappedStates:
-            policy[s] = "west"
-        self.policy = policy
+        # a basic policy of always going west
+        self.actionTable = np.full(len(self.cells), mdpModel.ACTIONS.index('west'), dtype=np.uint8)
 
     def initializeReward(self, state):
         """ Initialize reward for every state """
@@ -187,108 +220,73 @@ class PolicyMDPAgent(Agent):
         self.food_reward = 5
         self.empty_reward = -2
 
-    def updateReward(self, state):
-        """
-            Update reward for every cell that is not a wall.
-            Food reward: food reward will be set differently based on the number of surrounded walls, e.g. food in the
-                corners will assigned lower value than those at a crossing. Additionally, we will boost the reward of
-                the last piece of food since it's the terminal state of the game.
-        """
 
-        walls = api.walls(state)
-        foods = api.food(state)
-
-        # Empty reward
-        self.reward = {state: -1 for state in self.grid if state not in walls}
-        # Food reward
-        for food in foods:
-            count = self.countWalls(state, food)
-            if count <= 2:
-                # If the food is only surrounded by 2 or less than 2 walls, just set the reward for this food
-                self.reward[food] = self.food_reward
-            else:
-                # If the food is only surrounded by greater than 2 walls, suppress the reward for this food
-                self.reward[food] = self.food_reward / (1 + count * count)
-        if self.checkLastFood(state):
-            self.reward[foods[0]] += self.food_reward
-
-    def countWalls(self, state, food):
-        """ Count the number of walls that near a piece of food """
-
-        walls = api.walls(state)
-        north = (food[0], food[1] + 1)
-        south = (food[0], food[1] - 1)
-        west = (food[0] + 1, food[1])
-        east = (food[0] - 1, food[1])
-        count = 0
-        if north in walls:
-            count += 1
-        if south in walls:
-            count += 1
-        if west in walls:
-            count += 1
-        if east in walls:
-            count += 1
-        return count
-
-    def checkLastFood(self, state):
-        """ check if there is only one piece of food """
-
-        foods = api.food(state)
-        if len(foods) == 1:
-            return True
-        else:
-            return False        
-
-    def resetUtility(self, state):
-        """ Initialize all cells' utility to 0 """
-
-        walls = api.walls(state)
-        self.utils = {state: 0 for state in self.grid if state not in walls}
-
-    def mapState(self, state):
-        """ # Map reachable states for 4 directions of all states """
-
-        walls = api.walls(state)
-        states = dict.fromkeys(self.reward.keys())
-
-        # Iterate all cells in the map and map their potential states in 4 directions.
-        for cell in states.keys():
-            neighbours = self.fourNeighbours(cell)
-            states[cell] = {'north': [neighbours[3], neighbours[0], neighbours[2]],
-                            'south': [neighbours[1], neighbours[0], neighbours[2]],
-                            'east': [neighbours[0], neighbours[3], neighbours[1]],
-                            'west': [neighbours[2], neighbours[3], neighbours[1]]}
-
-            # Iterate all 4 directions and iterate all 3 potential states in one direction if any potential state
-            # is wall, set it the original cell
-            for _, possibleStates in states[cell].items():
-                for state in possibleStates:
-                    if state in walls:
-                        possibleStates[possibleStates.index(state)] = cell
-        self.mappedStates = states
-
-    def fourNeighbours(self, cell):
-        """ Get 4 adjacent neighbours of a cell """
-
-        (x, y) = cell
-        east = (x + 1, y)
-        south = (x, y - 1)
-        west = (x - 1, y)
-        north = (x, y + 1)
-        return [east, south, west, north]
-
-    def makeGrid(self, state):
-        """
-            Create a grid of the whole game map.
-            Notice the data structure for grid is set because it can be quickly accessed.
-        """
+class ModifiedPolicyMDPAgent(PolicyMDPAgent):
+    """
+        Modified policy iteration: after each greedy improvement the new policy is only partially evaluated, with k
+        sweeps of the policy's backup, before improving again. k=0 is value iteration and a large k approaches policy
+        iteration. It reuses PolicyMDPAgent's model (loadModel) and its backup
+        U = p * (R + gamma * P_policy U), and stops when an improvement step keeps the policy and changes no utility
+        by more than self.error.
+
+        Select with -p ModifiedPolicyMDPAgent -a k=5. final() reports the number of state backups, sweeps and the
+        solver's wall time, to tune k for a layout.
+    """
+    solverName = 'Modified Policy Iteration'
+
+    def __init__(self, k=5, online=False, budget=0.05, cache='', trace=''):
+        # The k sweeps are the policy evaluation, so there is no evaluation mode to choose
+        PolicyMDPAgent.__init__(self, 'iterative', online, budget, cache, trace)
+        self.k = int(k)                               # partial evaluation sweeps between improvements
+        self.sweeps = 0                               # sweeps over all states done by the solver
+        self.solveTime = 0                            # wall time of the solver in seconds
+
+    def final(self, state):
+        PolicyMDPAgent.final(self, state)
+        print('Backups: %d in %d sweeps (k=%d)' % (self.backups, self.sweeps, self.k))
+        print('Solve time: %.5f seconds' % self.solveTime)
+
+    def loadSolution(self, state):
+        self.backups = self.sweeps = 0
+        self.solveTime = 0
+        return PolicyMDPAgent.loadSolution(self, state)
+
+    def solutionParameters(self):
+        return PolicyMDPAgent.solutionParameters(self) + (self.k,)
+
+    def policyIteration(self, state):
+        startTime = time.time()
+        rows = np.arange(len(self.cells))
+        straight, left, right = self.nextStates[:, :, 0], self.nextStates[:, :, 1], self.nextStates[:, :, 2]
+        utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+        actions = self.actionTable
+        self.backups = self.sweeps = 0
+        self.startTrace('modified policy iteration (k=%d)' % self.k, actions)
+
+        while True:
+            # Greedy improvement, which is also one backup of the improved policy
+            expected = self.actionProb * utils[straight] + self.otherActionProb * utils[left] + \
+                self.otherActionProb * utils[right]
+            bestActions = expected.argmax(axis=1).astype(np.uint8)
+            newUtils = self.actionProb * (self.rewards + self.gamma * expected[rows, bestActions])
+            delta = np.abs(newUtils - utils).max()
+            stable = (bestActions == actions).all()
+            utils, actions = newUtils, bestActions
+            self.backups += len(rows)
+            self.sweeps += 1
+            self.recordSweep(delta, utils, actions)
+            if (stable and delta < self.error) or self.outOfTime():
+                break
 
-        corners = api.corners(state)
-        BL = corners[0]         # Bottom left corner
-        TR = corners[3]         # Top right corner
-        self.width = TR[0]+1    # store the width of the game map
-        self.height = TR[1]+1   # store the height of the game map
-        width = range(BL[0], TR[0]+1)
-        height = range(BL[1], TR[1]+1)
-        self.grid = set((x, y) for x in width for y in height)  # build up the game grid in a python set
\ No newline at end of file
+            # Partial evaluation of the improved policy
+            nextStates = self.nextStates[rows, actions]
+            for _ in range(self.k):
+                utils = self.actionProb * (self.rewards + self.gamma * (
+                    self.actionProb * utils[nextStates[:, 0]] + self.otherActionProb *
+                    utils[nextStates[:, 1]] + self.otherActionProb * utils[nextStates[:, 2]]))
+            self.backups += self.k * len(rows)
+            self.sweeps += self.k
+
+        self.utils = dict(zip(self.cells, utils.tolist()))
+        self.actionTable = actions
+        self.solveTime = time.time() - startTime
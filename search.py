@@ -54,62 +54,151 @@ class SearchProblem:
         """
         util.raiseNotDefined()
 
-def depthFirstSearch(problem):
-    visited_node = []
+def reconstructPath(closed, goal):
+    """
+    Rebuilds the list of actions leading to goal by following the parent
+    pointers stored in closed, which maps each expanded state to a
+    (parentState, action) pair.  The start state maps to (None, None).
+    """
     actions = []
-    stack = util.Stack()
+    parent, action = closed[goal]
+    while action is not None:
+        actions.append(action)
+        parent, action = closed[parent]
+    actions.reverse()
+    return actions
 
+def graphSearch(problem, frontier):
+    """
+    Generic graph search shared by depthFirstSearch and breadthFirstSearch.
+    The frontier decides the expansion order; it holds flat
+    (state, parentState, action, pathCost) nodes so memory per node does not
+    grow with the length of the path.  Expanded states go in a hashed closed
+    dict that doubles as the parent-pointer table, and the action list is
+    only rebuilt once the goal has been popped.
+    """
     # Gets the starting state of the problem.
-    start_node = problem.getStartState() 
+    start_node = problem.getStartState()
     # If the starting state is a goal state, return an empty list because no actions need to be taken.
     if problem.isGoalState(start_node):
         return []
 
-    # Adds the starting node and the empty list of actions to the stack.
-    stack.push((start_node, actions))
-
-    # While stack is not empty
-    while stack:
-        # Pop the next node and its corresponding list of actions from the stack.
-        node, action = stack.pop()
-        if node not in visited_node:
-            # Add the node to the list of visited nodes.
-            visited_node.append(node)
-            # If the node is a goal state, return the list of actions taken to reach the node.
-            if problem.isGoalState(node):
-                return action
-            for successor, direction, cost in problem.getSuccessors(node):
-                new_action = action + [direction]
-                stack.push((successor, new_action))
+    closed = {}
+    frontier.push((start_node, None, None, 0))
+
+    # While frontier is not empty
+    while not frontier.isEmpty():
+        # Pop the next node, the state it was reached from and the action taken to get there.
+        node, parent, action, prev_cost = frontier.pop()
+        if node in closed:
+            continue
+        # Record how the node was reached; this also marks it as visited.
+        closed[node] = (parent, action)
+        # If the node is a goal state, walk the parent pointers back to the start.
+        if problem.isGoalState(node):
+            return reconstructPath(closed, node)
+        for successor, direction, cost in problem.getSuccessors(node):
+            # If the successor has already been visited, skip it.
+            if successor in closed:
+                continue
+            frontier.push((successor, node, direction, prev_cost + cost))
     return []
 
+def depthFirstSearch(problem):
+    return graphSearch(problem, util.Stack())
+
 def breadthFirstSearch(problem):
-    visited_node = []
-    actions = []
-    queue = util.Queue()
+    return graphSearch(problem, util.Queue())
+
+class ReversedProblem:
+    """
+    A view of a reversible search problem with the start and goal swapped,
+    used for the backward half of the bidirectional searches.  The wrapped
+    problem must expose a single goal state as problem.goal and a
+    getPredecessors method returning (predecessor, action, stepCost)
+    triples, where action leads from the predecessor to the given state.
+
+    Any other attribute is looked up on the wrapped problem, so heuristics
+    that read problem.goal estimate the distance back to the start.
+    """
+
+    def __init__(self, problem):
+        if not hasattr(problem, 'goal') or not hasattr(problem, 'getPredecessors'):
+            raise AttributeError(type(problem).__name__ + ' is not a reversible search problem.')
+        self.problem = problem
+        self.goal = problem.getStartState()
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+    def getStartState(self):
+        return self.problem.goal
+
+    def isGoalState(self, state):
+        return state == self.goal
+
+    def getSuccessors(self, state):
+        return self.problem.getPredecessors(state)
+
+def joinPaths(forward, backward, meet):
+    """
+    Joins the halves of a bidirectional search at the meeting state.
+    forward maps states to (parentState, action) pairs pointing back to the
+    start; backward maps states to (childState, action) pairs pointing on to
+    the goal.
+    """
+    actions = reconstructPath(forward, meet)
+    child, action = backward[meet]
+    while action is not None:
+        actions.append(action)
+        child, action = backward[child]
+    return actions
 
+def bidirectionalSearch(problem):
+    """
+    Breadth first search run from the start and the goal at the same time.
+    Whole layers are expanded on the side with the smaller frontier until the
+    two searches touch, so roughly 2 * b^(d/2) states are expanded instead of
+    b^d.  Like breadthFirstSearch it finds the path with the fewest actions.
+    """
+    reverse = ReversedProblem(problem)
     # Gets the starting state of the problem.
-    start_node = problem.getStartState() 
+    start_node = problem.getStartState()
     # If the starting state is a goal state, return an empty list because no actions need to be taken.
     if problem.isGoalState(start_node):
         return []
-    
-    # Insert start node into the queue
-    queue.push((start_node, actions)) 
-
-    # While quere is not empty
-    while queue: 
-        # Pop the next node and its corresponding list of actions from the queue.
-        node, action = queue.pop() 
-        # Process all the neighbors of front node
-        if node not in visited_node:
-            visited_node.append(node)
-            # If the node is a goal state, return the list of actions taken to reach the node.
-            if problem.isGoalState(node):
-                return action
-            for successor, direction, cost in problem.getSuccessors(node):
-                new_action = action + [direction] 
-                queue.push((successor, new_action))
+    goal_node = reverse.getStartState()
+
+    # Parent pointers and depths for each side.
+    parents = ({start_node: (None, None)}, {goal_node: (None, None)})
+    depths = ({start_node: 0}, {goal_node: 0})
+    layers = ([start_node], [goal_node])
+    sides = (problem, reverse)
+
+    # While both frontiers are not empty
+    while layers[0] and layers[1]:
+        # Grow the smaller frontier by one whole layer.
+        side = 0 if len(layers[0]) <= len(layers[1]) else 1
+        other = 1 - side
+        best, meet = None, None
+        layer = []
+        for node in layers[side]:
+            for successor, direction, cost in sides[side].getSuccessors(node):
+                if successor in parents[side]:
+                    continue
+                parents[side][successor] = (node, direction)
+                depths[side][successor] = depths[side][node] + 1
+                layer.append(successor)
+                # The two searches have touched; keep the shortest join found in this layer.
+                if successor in parents[other]:
+                    total = depths[side][successor] + depths[other][successor]
+                    if best is None or total < best:
+                        best, meet = total, successor
+        layers = (layer, layers[1]) if side == 0 else (layers[0], layer)
+        if meet is not None:
+            # Let the problem display its expanded cells, as the forward goal test would.
+            problem.isGoalState(goal_node)
+            return joinPaths(parents[0], parents[1], meet)
     return []
 
 def nullHeuristic(state, problem=None):
@@ -119,39 +208,179 @@ def nullHeuristic(state, problem=None):
     """
     return 0
 
+def bestFirstSearch(problem, frontier, heuristic=nullHeuristic):
+    """
+    Generic cost-ordered graph search shared by uniformCostSearch and
+    aStarSearch.  The frontier is keyed by state, as util.IndexedPriorityQueue
+    and util.BucketQueue are, so a cheaper path to a queued state lowers its
+    priority in place and each state is on the open list at most once.  Best
+    path costs and parent pointers are kept in dicts and the action list is
+    only rebuilt once the goal has been popped.
+    """
+    # Gets the starting state of the problem.
+    start_node = problem.getStartState()
+    # If the starting state is a goal state, return an empty list because no actions need to be taken.
+    if problem.isGoalState(start_node):
+        return []
+
+    parents = {start_node: (None, None)}
+    costs = {start_node: 0}
+    closed = set()
+    frontier.push(start_node, heuristic(start_node, problem))
+
+    # While frontier is not empty
+    while not frontier.isEmpty():
+        node = frontier.pop()
+        closed.add(node)
+        # If the node is a goal state, walk the parent pointers back to the start.
+        if problem.isGoalState(node):
+            return reconstructPath(parents, node)
+        for successor, direction, cost in problem.getSuccessors(node):
+            # If the successor has already been expanded, skip it.
+            if successor in closed:
+                continue
+            new_cost = costs[node] + cost
+            # Only keep the successor if this is the cheapest path to it so far.
+            if successor in costs and costs[successor] <= new_cost:
+                continue
+            costs[successor] = new_cost
+            parents[successor] = (node, direction)
+            # Ties on f go to the deeper state, which is usually closer to the goal.
+            frontier.push(successor, new_cost + heuristic(successor, problem), new_cost)
+    return []
+
+def uniformCostSearch(problem):
+    # States are ordered by g, the best path cost found so far.
+    return bestFirstSearch(problem, util.BucketQueue())
+
 def aStarSearch(problem, heuristic=nullHeuristic):
-    visited_node = []
+    # States are ordered by f = g + h, where g is the best path cost found so far.
+    # The bucket queue falls back to a binary heap if a cost or heuristic value is fractional.
+    return bestFirstSearch(problem, util.BucketQueue(), heuristic)
+
+def bidirectionalAStarSearch(problem, heuristic=nullHeuristic):
+    """
+    A* run from the start towards the goal and from the goal back towards the
+    start, meeting in the middle (the MM algorithm of Holte et al.).  The
+    heuristic is called with a ReversedProblem on the backward side, so a
+    heuristic that measures the distance to problem.goal works unchanged.
+
+    A state with cost g and estimate h is queued on its side with priority
+    max(g + h, 2 * g), so neither side goes past the middle of the optimal
+    path, and ties go to the larger g as in aStarSearch.  Each step expands
+    the side with the lower priority, or the smaller open list on a tie.
+    States already expanded by the other side, and states whose f value
+    cannot beat the best join found so far, are not expanded at all.
+
+    The search stops once the best join is no longer than the lowest
+    priority on either side, which keeps the result optimal for consistent
+    heuristics.
+    """
+    reverse = ReversedProblem(problem)
     # Gets the starting state of the problem.
-    start_node = problem.getStartState() 
+    start_node = problem.getStartState()
     # If the starting state is a goal state, return an empty list because no actions need to be taken.
     if problem.isGoalState(start_node):
-        return [] 
-    
-    queue = util.PriorityQueue()
-    # Adds the starting node, the empty list of actions, and a cost of 0 to the priority queue. 
-    queue.push((start_node, [], 0), 0)
-
-    # While queue is not empty
-    while not queue.isEmpty():
-        # Pop the next node, its corresponding list of actions, and its previous cost from the priority queue.
-        node, action, prev_cost = queue.pop()
-        if node not in visited_node:
-            # Add the node to the list of visited nodes.
-            visited_node.append(node)
-            # If the node is a goal state, return the list of actions taken to reach the node.
-            if problem.isGoalState(node):
-                return action
-            for successor, direction, cost in problem.getSuccessors(node):
-                # If the successor has already been visited, skip it.
-                if successor in visited_node:
-                    continue
-                # Create a new list of actions that includes the action taken to get to the successor.
-                new_action = action + [direction]
-                # Calculate the new cost of getting to the successor by adding the cost of the action taken to the previous cost.
-                new_cost = prev_cost + cost
-                # Calculate the new heuristic for the successor node by adding the new cost to the estimated cost from the successor
-                # to the goal state, as determined by the heuristic function.
-                new_heuristic = new_cost + heuristic(successor, problem)
-                # Add the successor, the new list of actions, and the new cost to the priority queue, with the priority set to the new heuristic.
-                queue.push((successor, new_action, new_cost), new_heuristic)
+        return []
+    goal_node = reverse.getStartState()
+
+    sides = (problem, reverse)
+    parents = ({start_node: (None, None)}, {goal_node: (None, None)})
+    costs = ({start_node: 0}, {goal_node: 0})
+    closed = (set(), set())
+    frontiers = (util.BucketQueue(), util.BucketQueue())
+    frontiers[0].push(start_node, heuristic(start_node, problem))
+    frontiers[1].push(goal_node, heuristic(goal_node, reverse))
+    best, meet = float('inf'), None
+
+    # While both frontiers are not empty
+    while not frontiers[0].isEmpty() and not frontiers[1].isEmpty():
+        lowest = (frontiers[0].peekPriority(), len(frontiers[0])), (frontiers[1].peekPriority(), len(frontiers[1]))
+        # No unseen path can be cheaper than the lowest priority on either side.
+        if min(lowest)[0] >= best:
+            break
+        side = 0 if lowest[0] <= lowest[1] else 1
+        other = 1 - side
+        node = frontiers[side].pop()
+        closed[side].add(node)
+        # Both costs of a state the other side has expanded are known, and so is its join.
+        if node in closed[other] or costs[side][node] + heuristic(node, sides[side]) >= best:
+            continue
+        for successor, direction, cost in sides[side].getSuccessors(node):
+            # If the successor has already been expanded on this side, skip it.
+            if successor in closed[side]:
+                continue
+            new_cost = costs[side][node] + cost
+            if successor in costs[side] and costs[side][successor] <= new_cost:
+                continue
+            costs[side][successor] = new_cost
+            parents[side][successor] = (node, direction)
+            # The two searches have touched; remember the cheapest join.
+            if successor in costs[other] and new_cost + costs[other][successor] < best:
+                best, meet = new_cost + costs[other][successor], successor
+            estimate = new_cost + heuristic(successor, sides[side])
+            # A successor that cannot lead to a cheaper join is never queued.
+            if estimate < best:
+                frontiers[side].push(successor, max(estimate, 2 * new_cost), new_cost)
+
+    if meet is None:
+        return []
+    # Let the problem display its expanded cells, as the forward goal test would.
+    problem.isGoalState(goal_node)
+    return joinPaths(parents[0], parents[1], meet)
+
+def jumpPath(closed, goal):
+    """
+    Rebuilds the action list for jumpPointSearch.  Each parent pointer spans
+    a straight segment, so its action is repeated once per cell between the
+    jump point and its parent.
+    """
+    actions = []
+    node = goal
+    parent, action = closed[node]
+    while action is not None:
+        actions.extend([action] * util.manhattanDistance(parent, node))
+        node = parent
+        parent, action = closed[node]
+    actions.reverse()
+    return actions
+
+def jumpPointSearch(problem, heuristic=nullHeuristic):
+    """
+    A* over jump points for 4-connected grid problems with a uniform step
+    cost.  The problem's getJumpSuccessors(state, direction) replaces
+    getSuccessors and skips straight over cells that only lie on symmetric
+    paths, so far fewer states are expanded on open layouts.  The returned
+    path is the full list of single-step actions.
+    """
+    if not hasattr(problem, 'getJumpSuccessors'):
+        raise AttributeError(type(problem).__name__ + ' does not support jump point search.')
+    # Gets the starting state of the problem.
+    start_node = problem.getStartState()
+    # If the starting state is a goal state, return an empty list because no actions need to be taken.
+    if problem.isGoalState(start_node):
+        return []
+
+    parents = {start_node: (None, None)}
+    costs = {start_node: 0}
+    closed = set()
+    frontier = util.IndexedPriorityQueue()
+    frontier.push(start_node, heuristic(start_node, problem))
+
+    # While frontier is not empty
+    while not frontier.isEmpty():
+        node = frontier.pop()
+        closed.add(node)
+        if problem.isGoalState(node):
+            return jumpPath(parents, node)
+        # The direction the node was reached by decides which jumps are worth taking.
+        for successor, direction, cost in problem.getJumpSuccessors(node, parents[node][1]):
+            if successor in closed:
+                continue
+            new_cost = costs[node] + cost
+            if successor in costs and costs[successor] <= new_cost:
+                continue
+            costs[successor] = new_cost
+            parents[successor] = (node, direction)
+            frontier.push(successor, new_cost + heuristic(successor, problem))
     return []
@@ -62,7 +62,11 @@ class SearchAgent(Agent):
     Options for fn include:
       depthFirstSearch
       breadthFirstSearch
+      uniformCostSearch
       aStarSearch
+      bidirectionalSearch
+      bidirectionalAStarSearch
+      jumpPointSearch
 
     Note: You should NOT change any code in SearchAgent
     """
@@ -153,6 +157,7 @@ class PositionSearchProblem(search.SearchProblem):
         goal: A position in the gameState
         """
         self.walls = gameState.getWalls()
+        self.graph = gameState.getLayoutGraph()
         self.startState = gameState.getPacmanPosition()
         if start != None: self.startState = start
         self.goal = goal
@@ -193,12 +198,12 @@ class PositionSearchProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
+        graph = self.graph
+        first = 4 * graph.cellId(state)
+        for d, action in enumerate(graph.DIRECTIONS):
+            nextCell = graph.successors[first + d]
+            if nextCell >= 0:
+                nextState = graph.cells[nextCell]
                 cost = self.costFn(nextState)
                 successors.append( ( nextState, action, cost) )
 
@@ -209,6 +214,99 @@ class PositionSearchProblem(search.SearchProblem):
             self._visitedlist.append(state)
         return successors
 
+    def getPredecessors(self, state):
+        """
+        Returns the states from which state can be reached in one move, as
+        (predecessor, action, stepCost) triples where 'action' leads from the
+        predecessor to state and 'stepCost' is the cost of that move.  Moves
+        are reversible, so these are the successors with the actions turned
+        around.  Used by the backward half of the bidirectional searches.
+        """
+
+        predecessors = []
+        graph = self.graph
+        first = 4 * graph.cellId(state)
+        for d, action in enumerate(graph.DIRECTIONS):
+            # d ^ 1 is the opposite direction, so this is the cell 'action' leads from.
+            prevCell = graph.successors[first + (d ^ 1)]
+            if prevCell >= 0:
+                predecessors.append( ( graph.cells[prevCell], action, self.costFn(state)) )
+
+        # Bookkeeping for display purposes
+        self._expanded += 1
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+        return predecessors
+
+    def getJumpSuccessors(self, state, direction=None):
+        """
+        Returns the jump points reachable from state in a straight line, as
+        (jumpPoint, action, stepCost) triples where 'action' is repeated
+        until jumpPoint is reached and 'stepCost' is the cost of the whole
+        segment.  'direction' is the action state was reached by, or None for
+        the start.  Used by jumpPointSearch, which assumes a uniform costFn.
+
+        Symmetric paths are pruned by preferring to turn north or south as
+        early as possible: after a move east or west only that direction is
+        followed, plus any north or south neighbour that the previous cell
+        could not have reached (a forced neighbour).  After a move north or
+        south the search may also turn east or west.
+        """
+
+        if direction is None:
+            actions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+        elif direction in [Directions.EAST, Directions.WEST]:
+            x,y = state
+            dx, _ = Actions.directionToVector(direction)
+            prevx = int(x - dx)
+            actions = [direction]
+            if not self.walls[x][y + 1] and self.walls[prevx][y + 1]:
+                actions.append(Directions.NORTH)
+            if not self.walls[x][y - 1] and self.walls[prevx][y - 1]:
+                actions.append(Directions.SOUTH)
+        else:
+            actions = [direction, Directions.EAST, Directions.WEST]
+
+        successors = []
+        for action in actions:
+            jump = self._jump(state, action)
+            if jump is not None:
+                successors.append( (jump[0], action, jump[1]) )
+
+        # Bookkeeping for display purposes
+        self._expanded += 1
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+        return successors
+
+    def _jump(self, state, action):
+        """
+        Moves from state in the given direction until a jump point is found,
+        returning (jumpPoint, cost), or None if a wall is hit first.
+        """
+        x,y = state
+        dx, dy = Actions.directionToVector(action)
+        dx, dy = int(dx), int(dy)
+        cost = 0
+        while True:
+            x, y = x + dx, y + dy
+            if self.walls[x][y]:
+                return None
+            cost += self.costFn((x, y))
+            if (x, y) == self.goal:
+                return (x, y), cost
+            if dx:
+                # A north or south neighbour the previous cell cannot reach is forced.
+                if (not self.walls[x][y + 1] and self.walls[x - dx][y + 1]) or \
+                   (not self.walls[x][y - 1] and self.walls[x - dx][y - 1]):
+                    return (x, y), cost
+            elif self._jump((x, y), Directions.EAST) is not None or \
+                 self._jump((x, y), Directions.WEST) is not None:
+                # Turning east or west from here leads to a jump point.
+                return (x, y), cost
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -0,0 +1,88 @@
+# successorBenchmark.py
+# ---------
+
+"""
+Measures how fast the game engine generates successor states, the inner
+loop of any agent that searches over GameStates.  For each layout, a
+random walk of all the agents is played from the start, and at every step
+the successor of every legal action of the agent to move is generated.
+Reports successors per second and the memory allocated per successor:
+
+> python successorBenchmark.py -l smallClassic,originalClassic -n 20000
+"""
+
+from optparse import OptionParser
+import display.layout as layout
+import pacman
+import random
+import sys
+import time
+import tracemalloc
+
+def walk(state, successors, seed=0):
+    """
+    Generates 'successors' successor states on a random walk from state.
+    Returns them all, so the memory they take can be measured.
+    """
+
+    rng = random.Random(seed)
+    start, generated, agent = state, [], 0
+    while len(generated) < successors:
+        if state.isWin() or state.isLose():
+            state, agent = start, 0
+        children = [state.generateSuccessor(agent, action) for action in state.getLegalActions(agent)]
+        generated.extend(children)
+        state = rng.choice(children)
+        agent = (agent + 1) % state.getNumAgents()
+    return generated
+
+def benchmark(theLayout, successors, ghosts, repeats=5):
+    """ Returns the best successors per second of 'repeats' walks, and the bytes allocated per successor """
+
+    state = pacman.GameState()
+    state.initialize(theLayout, ghosts)
+    rates = []
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        walk(state, successors)
+        rates.append(successors / (time.perf_counter() - startTime))
+
+    tracemalloc.start()
+    generated = walk(state, successors)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del generated
+    return max(rates), size / successors
+
+def readCommand(argv):
+    """ Processes the command used to run successorBenchmark from the command line. """
+
+    usageStr = """
+    USAGE:      python successorBenchmark.py <options>
+    EXAMPLES:   python successorBenchmark.py -l smallClassic,originalClassic -n 20000
+                    - times 20000 successors on each of the two layouts
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-l', '--layouts', dest='layouts', default='smallClassic,mediumClassic,originalClassic',
+                      help='comma separated LAYOUT_FILEs [Default: smallClassic,mediumClassic,originalClassic]')
+    parser.add_option('-n', '--successors', dest='successors', type='int', default=20000,
+                      help='successors to generate per walk [Default: 20000]')
+    parser.add_option('-k', '--numghosts', dest='ghosts', type='int', default=4,
+                      help='the maximum number of ghosts [Default: 4]')
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    layouts = []
+    for name in options.layouts.split(','):
+        theLayout = layout.getLayout(name)
+        if theLayout == None: raise Exception("The layout " + name + " cannot be found")
+        layouts.append((name, theLayout))
+    return layouts, options.successors, options.ghosts
+
+if __name__ == '__main__':
+    layouts, successors, ghosts = readCommand(sys.argv[1:])
+    print('%-16s %14s %16s' % ('layout', 'successors/s', 'bytes/successor'))
+    for name, theLayout in layouts:
+        rate, size = benchmark(theLayout, successors, ghosts)
+        print('%-16s %14.0f %16.0f' % (name, rate, size))
@@ -6,24 +6,48 @@
 # attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
 
 from pacman import Directions
-from game_modules.game import Agent
+import game_modules.util as util
 import api
+import mdpModel
+import mdpParallel
+import multiprocessing
+import numpy as np
 import time
 
-class ValueMDPAgent(Agent):
+class ValueMDPAgent(mdpModel.MDPAgent):
+    # Value iteration solvers selectable with -a solver=..., and the method that runs each
+    solvers = {'vectorized': 'vectorValueIteration',
+               'dict': 'dictValueIteration',
+               'gaussSeidel': 'gaussSeidelValueIteration',
+               'prioritized': 'prioritizedValueIteration',
+               'tiled': 'tiledValueIteration',
+               'scc': 'componentValueIteration'}
+
     # Constructor: this gets run when we first invoke pacman.py
-    def __init__(self, fn='value'):
+    def __init__(self, fn='value', solver='vectorized', online=False, budget=0.05, cache='', trace='',
+                 workers=0, tiles=0, timeLimit=0):
+        # Solvers: 'vectorized' runs Jacobi sweeps on NumPy arrays, 'dict' on the Python dicts below, 'gaussSeidel'
+        # sweeps in place, 'prioritized' only backs up states whose successors changed, 'tiled' splits the
+        # vectorized sweeps over processes and 'scc' solves one strongly connected component at a time
+        if solver not in self.solvers:
+            raise AttributeError(solver + ' is not a value iteration solver: ' + ', '.join(self.solvers))
+        mdpModel.MDPAgent.__init__(self, online, budget, cache, trace)
+        self.solver = solver
+        # The tiled solver's processes (by default one per core) and the tiles it cuts the layout into (by default
+        # one per process). Its processes are kept for all the solves of a game, and stopped by final()
+        if solver == 'tiled':
+            self.workers = int(workers) or multiprocessing.cpu_count()
+            self.tiles = int(tiles) or self.workers
+        self.tiledSolver = None                       # the running mdpParallel.TiledSolver, if any
+        self.componentOrder = None                    # the 'scc' solver's (model, food ids, ordered components)
+
         # Maps:
-        self.grid = set()                             # a set of all possible states in the game
-        self.mappedStates = {}                        # a dict mapping all possible states to 4 directions
-        self.reward = {}                              # a dict which stores reward of each cell
         self.utils = {}                               # a dict which stores utility of each cell
-        self.actions = []
+        self.actionTable = np.zeros(0, dtype=np.uint8)  # best action of each state id, an index into mdpModel.ACTIONS
         self.cost = 0
+        self.backups = 0                              # Bellman backups done by the solver
 
         # Hyper-parameters:
-        self.width = 0                                # width of the game map
-        self.height = 0                               # height of the game map
         self.error = 0.001                            # error for convergence
         self.gamma = 0.9                              # discount factor
         self.actionProb = api.directionProb           # non-deterministic probability of policy: 0.8
@@ -33,22 +57,47 @@ class ValueMDPAgent(Agent):
         self.food_reward = 0                          # Food reward
         self.empty_reward = 0                         # Empty cell reward
 
+        # Anytime solving: the first solve of a game stops after timeLimit seconds (0 for no limit) with the best
+        # policy so far, and self.bellmanError bounds how far its utilities are from optimal. The limit counts from
+        # the start of registerInitialState, so it includes building the model; the deadline is checked before
+        # every sweep. The solve then carries on for self.budget seconds per move until it converges
+        self.timeLimit = float(timeLimit)
+        self.timedOut = False                         # whether the last solve was stopped by its deadline
+        self.initialState = None                      # the state of the first solve, to save its refined solution
+        self.bellmanError = 0                         # largest Bellman residual of the utilities in use
+
     # Gets run after an MDPAgent object is created and once there is
     # game state to access.
     def registerInitialState(self, state):
         print("Running Value Iteration MDPAgent!")
         startTime = time.time()
-        # 1. Create a set of all states of the game                         -> self.grid
-        self.makeGrid(state)
-        # 2. Initialize rewards values based on the size of the map         -> self.xxx_reward and hyper-parameters
+        self.games += 1
+        # 1. Initialize rewards values based on the size of the map         -> self.xxx_reward and hyper-parameters
         self.initializeReward(state)
-        # 3. Initialize rewards of each state (except for walls)            -> self.reward (dict)
-        self.updateReward(state)
-        # 4. Initialize all grids' utility to 0                             -> self.utility (dict)
-        self.resetUtility(state)
-        # 5. Map Pacman's all possible states to its 4 adjacent directions  -> self.mappedStates
-        self.mapState(state)
-        self.valueIteration(state)
+        # 2. Load the states, transitions and rewards of the layout         -> self.cells, self.nextStates, ...
+        self.loadModel(state)
+        # 3. Initialize all grids' utility to 0                             -> self.utils (dict)
+        self.utils = dict.fromkeys(self.cells, 0)
+        self.food = api.foodSet(state)
+        # 4. Solve, or load the solution of an earlier game with the same layout and parameters
+        self.initialState = state
+        if self.loadSolution(state):
+            # A cached solution has converged, so nothing is left to refine
+            self.backups = 0
+            self.timedOut = False
+            self.bellmanError = self.bellmanResidual()
+        else:
+            if self.timeLimit:
+                self.deadline = startTime + self.timeLimit
+            self.valueIteration(state)
+            self.deadline = None
+            # An unfinished solve must not be reused as if it had converged
+            if not self.timedOut:
+                self.saveSolution(state)
+            else:
+                print('Stopped at the time limit after %.5f seconds and %d backups: Bellman error %.6f, utilities '
+                      'within %.6f of optimal' % (time.time() - startTime, self.backups, self.bellmanError,
+                                                  self.bellmanError / (1 - self.gamma)))
         self.timeTaken = time.time() - startTime
 
     # This is what gets run in between multiple games
@@ -56,9 +105,28 @@ class ValueMDPAgent(Agent):
         print("Maze Solved.")
         print('Cost: %.0f' % (self.cost))
         print('Time to find optimal path: %.5f seconds' % self.timeTaken)
-        print('Nodes Visited: %.0f' % (len(self.mappedStates)))
+        print('Nodes Visited: %.0f' % (len(self.cells)))
+        print('Backups: %d' % self.backups)
+        if self.timeLimit:
+            print('Bellman error: %.6f, utilities within %.6f of optimal%s' % (
+                self.bellmanError, self.bellmanError / (1 - self.gamma), ' (unfinished)' if self.timedOut else ''))
+        self.writeTrace()
+        if self.tiledSolver is not None:
+            self.tiledSolver.close()
+            self.tiledSolver = None
 
     def getAction(self, state):
+        replanned = self.online and self.replan(state)
+        if self.timedOut and not replanned:
+            # Keep refining a solve the time limit cut short, within the time budget of each move
+            backups = self.backups
+            self.deadline = time.time() + self.budget
+            self.valueIteration(state)
+            self.deadline = None
+            self.backups += backups
+            # Once it converges it is the solution of the first solve, unless eaten food has changed the rewards
+            if not self.timedOut and not (self.online and self.food != api.foodSet(self.initialState)):
+                self.saveSolution(self.initialState)
         policy = self.choosePolicy(state)
         legal = api.legalActions(state)
         self.cost += 1
@@ -66,9 +134,25 @@ class ValueMDPAgent(Agent):
             legal.remove(Directions.STOP)
         return api.makeMove(policy, legal)
 
+    def solve(self, state):
+        self.valueIteration(state)
+
     def valueIteration(self, state):
-        states = self.mappedStates  
-        reward = self.reward 
+        self.backups = 0
+        self.startTrace('value iteration (%s)' % self.solver)
+        # The deadline can pass before the first sweep, e.g. while a huge layout is compiled; the policy is then
+        # greedy in the utilities the solve started from
+        if not self.outOfTime():
+            getattr(self, self.solvers[self.solver])(state)
+        self.timedOut = self.outOfTime()
+        # Both read the utilities as an array; convert them once, as it counts against the deadline too
+        utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+        self.bellmanError = self.bellmanResidual(utils)
+        self.extractPolicy(utils)
+
+    def dictValueIteration(self, state):
+        states = self.model.stateMap()
+        reward = dict(zip(self.cells, self.rewards.tolist()))
         utils = self.utils
         prevUtils = dict(utils)
 
@@ -83,175 +167,208 @@ class ValueMDPAgent(Agent):
                             prevUtils[potentialGrids[1]] + self.otherActionProb * prevUtils[potentialGrids[2]]))
                 utils[coord] = max(tempUtils)
                 delta = max(delta, abs(utils[coord] - utility))
+            self.backups += len(prevUtils)
             prevUtils = dict(utils)
-            if delta < self.error:
+            if self.trace is not None:
+                self.recordSweep(delta, [utils[cell] for cell in self.cells])
+            if delta < self.error or self.outOfTime():
                 self.utils = dict(utils)
                 break
 
-    def choosePolicy(self, state):
-        # choose a direction which returns a maximum expected utility
-        pacman = api.whereAmI(state)
-        (x, y) = pacman
-        walls = api.walls(state)
-        north = (x, y+1)
-        south = (x, y-1)
-        east = (x+1, y)
-        west = (x-1, y)
-
-        # check if the next location is a wall, if its a wall, stop; otherwise, go
-        if north in walls:
-            north = pacman
-        if south in walls:
-            south = pacman
-        if east in walls:
-            east = pacman
-        if west in walls:
-            west = pacman
-
-        # calculate expected utility without reward, since reward is the same
-        North_EU = self.actionProb * self.utils[north] + \
-                   self.otherActionProb * self.utils[west] + \
-                   self.otherActionProb * self.utils[east]
-        South_EU = self.actionProb * self.utils[south] + \
-                   self.otherActionProb * self.utils[west] + \
-                   self.otherActionProb * self.utils[east]
-        East_EU = self.actionProb * self.utils[east] + \
-                  self.otherActionProb * self.utils[north] + \
-                  self.otherActionProb * self.utils[south]
-        West_EU = self.actionProb * self.utils[west] + \
-                  self.otherActionProb * self.utils[north] + \
-                  self.otherActionProb * self.utils[south]
-
-        # get the index of max expected utility
-        list = [North_EU, South_EU, East_EU, West_EU]
-        maxIndex = 0
-        for i in range(len(list)):
-            if list[i] > list[maxIndex]:
-                maxIndex = i
-
-        # return direction: 0-north  1-south  2-east  3-west
-        if maxIndex == 0:
-            self.actions.append(Directions.NORTH)
-            return Directions.NORTH
-        if maxIndex == 1:
-            self.actions.append(Directions.SOUTH)
-            return Directions.SOUTH
-        if maxIndex == 2:
-            self.actions.append(Directions.EAST)
-            return Directions.EAST
-        if maxIndex == 3:
-            self.actions.append(Directions.WEST)
-            return Directions.WEST
+    def vectorValueIteration(self, state):
+        """
+            Value iteration on flat arrays. Each sweep gathers the utilities of the 3 possible outcomes of every action
+            of every state from self.nextStates at once and takes the max over the action axis, so a sweep is a few
+            NumPy operations instead of a Python loop over states. The arithmetic is the same as dictValueIteration,
+            so it converges after the same number of sweeps to the same utilities.
+        """
 
-    def initializeReward(self, state):
-        self.food_reward = 5
-        self.empty_reward = -2
+        straight, left, right = self.nextStates[:, :, 0], self.nextStates[:, :, 1], self.nextStates[:, :, 2]
+        reward = self.rewards[:, np.newaxis]
+        utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+
+        while True:
+            newUtils = (reward + self.gamma * (
+                    self.actionProb * utils[straight] + self.otherActionProb *
+                    utils[left] + self.otherActionProb * utils[right])).max(axis=1)
+            delta = np.abs(newUtils - utils).max()
+            utils = newUtils
+            self.backups += len(utils)
+            self.recordSweep(delta, utils)
+            if delta < self.error or self.outOfTime():
+                break
+        self.utils = dict(zip(self.cells, utils.tolist()))
 
-    def updateReward(self, state):
+    def gaussSeidelValueIteration(self, state):
         """
-            Update reward for every cell that is not a wall.
-            Food reward: food reward will be set differently based on the number of surrounded walls, e.g. food in the
-                corners will assigned lower value than those at a crossing. Additionally, we will boost the reward of
-                the last piece of food since it's the terminal state of the game.
+            In-place value iteration: each backup reads the utilities already updated earlier in the same sweep, so
+            values spread further per sweep and no copy of the utilities is made.
         """
 
-        walls = api.walls(state)
-        foods = api.food(state)
-
-        # Empty reward
-        self.reward = {state: -1 for state in self.grid if state not in walls}
-        # Food reward
-        for food in foods:
-            count = self.countWalls(state, food)
-            if count <= 2:
-                # If the food is only surrounded by 2 or less than 2 walls, just set the reward for this food
-                self.reward[food] = self.food_reward
-            else:
-                # If the food is only surrounded by greater than 2 walls, suppress the reward for this food
-                self.reward[food] = self.food_reward / (1 + count * count)
-        if self.checkLastFood(state):
-            self.reward[foods[0]] += self.food_reward
+        nextStates = self.nextStates.tolist()
+        rewards = self.rewards.tolist()
+        utils = [self.utils[cell] for cell in self.cells]
 
-    def checkLastFood(self, state):
-        """ check if there is only one piece of food """
+        while True:
+            delta = 0
+            for s in range(len(utils)):
+                utility = self.bellmanBackup(s, utils, nextStates, rewards)
+                delta = max(delta, abs(utility - utils[s]))
+                utils[s] = utility
+            self.backups += len(utils)
+            self.recordSweep(delta, utils)
+            if delta < self.error or self.outOfTime():
+                break
+        self.utils = dict(zip(self.cells, utils))
 
-        foods = api.food(state)
-        if len(foods) == 1:
-            return True
-        else:
-            return False
-
-    def countWalls(self, state, food):
-        """ Count the number of walls that near a piece of food """
-
-        walls = api.walls(state)
-        north = (food[0], food[1] + 1)
-        south = (food[0], food[1] - 1)
-        west = (food[0] + 1, food[1])
-        east = (food[0] - 1, food[1])
-        count = 0
-        if north in walls:
-            count += 1
-        if south in walls:
-            count += 1
-        if west in walls:
-            count += 1
-        if east in walls:
-            count += 1
-        return count
-    
-    def resetUtility(self, state):
-        """ Initialize all cells' utility to 0 """
-
-        walls = api.walls(state)
-        self.utils = {state: 0 for state in self.grid if state not in walls}
-
-    def mapState(self, state):
-        """ # Map reachable states for 4 directions of all states """
-
-        walls = api.walls(state)
-        states = dict.fromkeys(self.reward.keys())
-
-        # Iterate all cells in the map and map their potential states in 4 directions.
-        for cell in states.keys():
-            neighbours = self.fourNeighbours(cell)
-            states[cell] = {'north': [neighbours[3], neighbours[0], neighbours[2]],
-                            'south': [neighbours[1], neighbours[0], neighbours[2]],
-                            'east': [neighbours[0], neighbours[3], neighbours[1]],
-                            'west': [neighbours[2], neighbours[3], neighbours[1]]}
-
-            # Iterate all 4 directions and iterate all 3 potential states in one direction if any potential state
-            # is wall, set it the original cell
-            for _, possibleStates in states[cell].items():
-                for state in possibleStates:
-                    if state in walls:
-                        possibleStates[possibleStates.index(state)] = cell
-        self.mappedStates = states
-
-    def fourNeighbours(self, cell):
-        """ Get 4 adjacent neighbours of a cell """
-
-        (x, y) = cell
-        east = (x + 1, y)
-        south = (x, y - 1)
-        west = (x - 1, y)
-        north = (x, y + 1)
-        return [east, south, west, north]
-
-    def makeGrid(self, state):
+    def prioritizedValueIteration(self, state):
         """
-            Create a grid of the whole game map.
-            Notice the data structure for grid is set because it can be quickly accessed.
+            Prioritized sweeping. Every state carries an upper bound on its Bellman residual, starting from the exact
+            residual after one vectorized sweep. The state with the largest bound is backed up next; when its utility
+            changes by c, each predecessor's bound grows by gamma * c * (the largest probability of reaching it from
+            that predecessor). States whose bound is below self.error are never queued, so work concentrates around
+            the rewards, and once the queue is empty every residual is below self.error.
         """
 
-        corners = api.corners(state)
-        BL = corners[0]         # Bottom left corner
-        TR = corners[3]         # Top right corner
-        self.width = TR[0]+1    # store the width of the game map
-        self.height = TR[1]+1   # store the height of the game map
-        width = range(BL[0], TR[0]+1)
-        height = range(BL[1], TR[1]+1)
-        self.grid = set((x, y) for x in width for y in height)  # build up the game grid in a python set
+        nextStates = self.nextStates.tolist()
+        rewards = self.rewards.tolist()
+        utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+
+        # Largest probability of moving from each predecessor into each state, over the 4 actions
+        predecessors = [{} for _ in nextStates]
+        probs = (self.actionProb, self.otherActionProb, self.otherActionProb)
+        for s, actions in enumerate(nextStates):
+            for outcomes in actions:
+                mass = {}
+                for next, prob in zip(outcomes, probs):
+                    mass[next] = mass.get(next, 0) + prob
+                for next, prob in mass.items():
+                    predecessors[next][s] = max(predecessors[next].get(s, 0), prob)
+
+        # Exact residuals of the starting utilities
+        expected = self.actionProb * utils[self.nextStates[:, :, 0]] + self.otherActionProb * \
+            utils[self.nextStates[:, :, 1]] + self.otherActionProb * utils[self.nextStates[:, :, 2]]
+        bounds = np.abs(self.rewards + self.gamma * expected.max(axis=1) - utils).tolist()
+        utils = utils.tolist()
+        self.backups += len(utils)
+
+        # Largest bound first: priorities are negated bounds
+        queue = util.IndexedPriorityQueue()
+        for s, bound in enumerate(bounds):
+            if bound >= self.error:
+                queue.push(s, -bound)
+
+        while not queue.isEmpty() and not self.outOfTime():
+            s = queue.pop()
+            bounds[s] = 0
+            utility = self.bellmanBackup(s, utils, nextStates, rewards)
+            change = abs(utility - utils[s])
+            utils[s] = utility
+            self.backups += 1
+            if self.trace is not None and self.backups % len(utils) == 0:
+                self.recordSweep(max(bounds), utils)
+            for predecessor, prob in predecessors[s].items():
+                bounds[predecessor] += self.gamma * prob * change
+                if bounds[predecessor] >= self.error:
+                    queue.push(predecessor, -bounds[predecessor])
+        self.utils = dict(zip(self.cells, utils))
+
+    def componentValueIteration(self, state):
+        """
+            Backups scheduled by the structure of the maze. The strongly connected components of the transition graph
+            are solved one at a time, each to convergence, in reverse topological order, so a component only starts
+            once the components it leads to have settled. Within a component, in-place sweeps visit the states in
+            order of their distance from the nearest food, so value spreads out from the rewards along corridors
+            within a single sweep instead of one cell per sweep.
+        """
 
+        nextStates = self.nextStates.tolist()
+        rewards = self.rewards.tolist()
+        utils = [self.utils[cell] for cell in self.cells]
+        # The components only depend on the layout; their order within only changes when food is eaten
+        food = [s for s, reward in enumerate(rewards) if reward > 0]
+        if self.componentOrder is None or self.componentOrder[:2] != (self.model, food):
+            distance = self.model.distances(food)
+            # States that cannot reach food go last
+            self.componentOrder = (self.model, food, [sorted(component, key=lambda s: (distance[s] < 0, distance[s]))
+                                                      for component in self.model.components()])
+
+        for component in self.componentOrder[2]:
+            while True:
+                delta = 0
+                for s in component:
+                    utility = self.bellmanBackup(s, utils, nextStates, rewards)
+                    delta = max(delta, abs(utility - utils[s]))
+                    utils[s] = utility
+                self.backups += len(component)
+                self.recordSweep(delta, utils)
+                if delta < self.error or self.outOfTime():
+                    break
+            if self.outOfTime():
+                break
+        self.utils = dict(zip(self.cells, utils))
+
+    def tiledValueIteration(self, state):
+        """
+            The sweeps of vectorValueIteration, with the states cut into tiles of whole columns that are backed up
+            by worker processes sharing the utilities (see mdpParallel.py). It converges after the same number of
+            sweeps to the same utilities. The workers are started by the first solve of a game and reused by the
+            online re-solves and the refinements of a timed-out solve.
+        """
+
+        if self.tiledSolver is None or self.tiledSolver.size != len(self.cells):
+            if self.tiledSolver is not None:
+                self.tiledSolver.close()
+            self.tiledSolver = mdpParallel.TiledSolver(self.cells, self.nextStates, self.gamma, self.actionProb,
+                                                       self.otherActionProb, self.tiles, self.workers)
+        solver = self.tiledSolver
+        solver.load([self.utils[cell] for cell in self.cells], self.rewards)
+        while True:
+            delta = solver.sweep()
+            self.backups += len(self.cells)
+            if self.trace is not None:
+                self.recordSweep(delta, solver.utils())
+            if delta < self.error or self.outOfTime():
+                break
+        self.utils = dict(zip(self.cells, solver.utils().tolist()))
+
+    def bellmanResidual(self, utils=None):
+        """
+            The largest change one more backup would make to self.utils (or to utils, the same utilities as an array
+            indexed by state id). If it is r, every utility is within r / (1 - gamma) of the optimal utility.
+        """
+
+        if utils is None:
+            utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+        expected = self.model.expectedUtilities(utils, self.actionProb, self.otherActionProb)
+        return float(np.abs(self.rewards + self.gamma * expected.max(axis=1) - utils).max()) if len(utils) else 0.0
+
+    def bellmanBackup(self, s, utils, nextStates, rewards):
+        """ The backed-up utility of state id s: its reward plus the discounted best expected utility """
 
+        return rewards[s] + self.gamma * max(
+            self.actionProb * utils[straight] + self.otherActionProb * utils[left] + self.otherActionProb * utils[right]
+            for straight, left, right in nextStates[s])
 
+    def solutionParameters(self):
+        """ Everything besides the layout and food that the solution depends on """
+
+        return (type(self).__name__, self.solver, self.gamma, self.error, self.actionProb, self.food_reward)
+
+    def extractPolicy(self, utils=None):
+        """
+            Store the greedy action of every state for the converged utilities in self.actionTable, so that choosing
+            a move is a single lookup. utils can give self.utils as an array indexed by state id.
+        """
+
+        if utils is None:
+            utils = np.array([self.utils[cell] for cell in self.cells], dtype=float)
+        self.actionTable = self.model.greedyActions(utils, self.actionProb, self.otherActionProb)
+
+    def choosePolicy(self, state):
+        # choose the direction with the maximum expected utility, from the action table of the current utilities
+        return mdpModel.DIRECTIONS[self.actionTable[self.ids[api.whereAmI(state)]]]
+
+    def initializeReward(self, state):
+        self.food_reward = 5
+        self.empty_reward = -2